@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # CocoMaterial apps
     'coco_material',
     'vectors',
@@ -96,11 +97,62 @@ DATABASES = {
         'USER': os.environ.get('COCO_DB_USER', 'coco'),
         'PASSWORD': os.environ.get('COCO_DB_PASSWORD', 'coco'),
         'HOST': os.environ.get('COCO_DB_HOST', '127.0.0.1'),
-        'PORT': os.environ.get('COCO_DB_PORT', '5432')
+        'PORT': os.environ.get('COCO_DB_PORT', '5432'),
+        'OPTIONS': {
+            # The threshold of the word similarity operator (`%>`) of the similarity filter
+            'options': '-c pg_trgm.word_similarity_threshold=0.35',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# NOTE: the catalog version (that invalidates the cached responses) and the payloads prebuilt by the
+# commands must be shared by all the processes. The default file based cache is shared by the workers
+# of one host, with several hosts use a memcached / redis backend (a local-memory one is not shared).
+# Keep it small: the file based cache lists all its files on every set to cull them. The svg contents
+# of the vectors (one entry per vector) go to the local-memory `contents` cache of each process, their
+# keys change with the files so they don't have to be shared.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('COCO_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('COCO_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'django')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('COCO_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+    'contents': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vector-contents',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('COCO_CONTENT_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+
+# Seconds the svg content of a vector is kept in the `contents` cache
+VECTOR_CONTENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Threads used to read the svg files of many vectors at once
+CONTENT_READ_WORKERS = 8
+
+# Seconds the ids of the vectors of each featured block are kept, to pick their random samples
+FEATURED_IDS_CACHE_TIMEOUT = 60 * 10
+
+# The featured endpoint serves one of FEATURED_ROTATION_VARIANTS cached payloads (each one with
+# different random vectors), and they are rebuilt every FEATURED_CACHE_TIMEOUT seconds
+FEATURED_ROTATION_VARIANTS = int(os.environ.get('COCO_FEATURED_ROTATION_VARIANTS', 5))
+FEATURED_CACHE_TIMEOUT = int(os.environ.get('COCO_FEATURED_CACHE_TIMEOUT', 60 * 10))
+
+# Seconds the count of each search (for the pagination) is kept in the cache
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+# Seconds the svg sprite of each tag is kept in the cache (it's rebuilt when its vectors change)
+SPRITE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -144,6 +196,28 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Rendered (customized svg / png) files, reused between downloads
+RENDER_CACHE_DIR = os.environ.get('COCO_RENDER_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'renders'))
+RENDER_CACHE_MAX_SIZE = int(os.environ.get('COCO_RENDER_CACHE_MAX_SIZE', 512 * 1024 * 1024))  # bytes
+
+# Threads of the `run_export_worker` command, seconds it waits for new exports when the queue
+# is empty, and seconds after which a running export is considered dead and taken again
+EXPORT_WORKERS = int(os.environ.get('COCO_EXPORT_WORKERS', 2))
+EXPORT_POLL_INTERVAL = int(os.environ.get('COCO_EXPORT_POLL_INTERVAL', 2))
+EXPORT_JOB_TIMEOUT = int(os.environ.get('COCO_EXPORT_JOB_TIMEOUT', 60 * 60))
+
+# Seconds a finished export (and its zip) is kept, until the worker deletes it, and how many exports
+# a client can request (the same export is reused while it's pending or kept)
+EXPORT_EXPIRATION = int(os.environ.get('COCO_EXPORT_EXPIRATION', 60 * 60 * 24))
+EXPORTS_THROTTLE_RATE = os.environ.get('COCO_EXPORTS_THROTTLE_RATE', '10/hour')
+
+# Size (px) of the PNG thumbnails of the vectors shown in the admin (70px at 2x)
+THUMBNAIL_SIZE = 140
+
+# Processes used to rasterize bulk exports, and how many renders one request can have in flight
+RENDER_POOL_WORKERS = int(os.environ.get('COCO_RENDER_POOL_WORKERS', os.cpu_count() or 1))
+RENDER_POOL_MAX_CONCURRENCY = int(os.environ.get('COCO_RENDER_POOL_MAX_CONCURRENCY', max(1, RENDER_POOL_WORKERS // 2)))
+
 
 TAGGIT_CASE_INSENSITIVE = True
 
@@ -166,6 +240,9 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter'
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'exports': EXPORTS_THROTTLE_RATE,
+    },
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
     # ],
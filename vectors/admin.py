@@ -1,21 +1,17 @@
-import base64
-import pathlib
-import tempfile
-from os.path import basename
-from zipfile import ZipFile
-
 from django.contrib import admin
 from django.contrib import messages
-from django.http import HttpResponse
+from django.urls import reverse
 from django.utils import timezone
-from django.utils.html import mark_safe
+from django.utils.html import format_html, mark_safe
 from django.utils.translation import ngettext
 
 # from django_admin_listfilter_dropdown.filters import RelatedDropdownFilter
 from adminsortable2.admin import SortableAdminMixin
 
-from vectors.models import Vector, Featured
-from vectors.services import images as images_services
+from vectors.models import ExportJob, Vector, Featured, update_search_text
+from vectors.services import batching
+from vectors.services import catalog as catalog_services
+from vectors.services import exports as exports_services
 
 
 @admin.register(Vector)
@@ -90,19 +86,20 @@ class VectorAdmin(admin.ModelAdmin):
 
     @admin.display(description="SVG (b/w)")
     def svg_image_thumb(self, obj):
-        if not obj.svg: return ""
-        return mark_safe(f'<img src="{obj.svg.url}" width=70 height=70 />')
+        thumbnail = obj.svg_thumbnail or obj.svg
+        if not thumbnail: return ""
+        return mark_safe(f'<img src="{thumbnail.url}" width=70 height=70 />')
 
     def colored_svg_image(self, obj):
-        if not obj.colored_svg_content: return ""
-        base64_svg = base64.b64encode(obj.colored_svg_content.encode('utf-8')).decode('utf-8')
-        return mark_safe(f'<img src="data:image/svg+xml;base64,{base64_svg}" width=128 height=128 />')
+        colored_svg = obj.colored_svg or obj.generated_colored_svg
+        if not colored_svg: return ""
+        return mark_safe(f'<img src="{colored_svg.url}" width=128 height=128 />')
 
     @admin.display(description="SVG (color)")
     def colored_svg_image_thumb(self, obj):
-        if not obj.colored_svg_content: return ""
-        base64_svg = base64.b64encode(obj.colored_svg_content.encode('utf-8')).decode('utf-8')
-        return mark_safe(f'<img src="data:image/svg+xml;base64,{base64_svg}" width=70 height=70 />')
+        thumbnail = obj.colored_svg_thumbnail or obj.colored_svg or obj.generated_colored_svg
+        if not thumbnail: return ""
+        return mark_safe(f'<img src="{thumbnail.url}" width=70 height=70 />')
 
     # Gif files
     def gif_image(self, obj):
@@ -123,13 +120,20 @@ class VectorAdmin(admin.ModelAdmin):
         if not obj.colored_gif: return ""
         return mark_safe(f'<img src="{obj.colored_gif.url}" width=70 height=70 />')
 
+    def changelist_view(self, request, extra_context=None):
+        # The changes of the list editable fields (i.e. the tags) update the search
+        # texts and the catalog once for all the vectors, instead of once per change
+        if request.method == 'POST':
+            with batching.batch():
+                return super().changelist_view(request, extra_context)
+        return super().changelist_view(request, extra_context)
+
     # Actions
     @admin.action(description='Recalculate search text')
     def recalculate_search_text(self, request, queryset):
-        for obj in queryset:
-            obj.recalculate_search_text()
+        count = update_search_text(queryset)
+        catalog_services.bump_version()
 
-        count = queryset.count()
         self.message_user(
             request,
             ngettext(
@@ -142,28 +146,32 @@ class VectorAdmin(admin.ModelAdmin):
 
     @admin.action(description='Get stroke svg files')
     def get_stroke_svg_files(self, request, queryset):
-        with tempfile.TemporaryDirectory() as directory:
-            # customize vectors' svg
-            for vector in queryset.exclude(svg__isnull=True):
-                images_services.customize_vector(
-                    vector.svg, directory,
-                    "000000", "none"
-                )
+        # The zip is made in the background (by the `run_export_worker` command)
+        job = exports_services.submit(
+            {
+                'ids': list(queryset.values_list('id', flat=True)),
+                'img_format': 'svg',
+                'stroke': '000000',
+                'fill': 'none',
+            },
+            f"stroke_svg_files-{timezone.now().isoformat()}.zip"
+        )
+        url = reverse('admin:vectors_exportjob_change', args=[job.pk])
+        self.message_user(
+            request,
+            format_html('The stroke svg files are being exported, download them from <a href="{}">{}</a>.', url, job.name),
+            messages.SUCCESS,
+        )
 
-            # Generate zip file
-            zip_name = f"stroke_svg_files-{timezone.now().isoformat()}.zip"
-            zip_file_name = f"{directory}/{zip_name}"
-            svgs = pathlib.Path(directory).glob('*.svg')
-            with ZipFile(zip_file_name, 'w') as zipfile:
-                for svg in svgs:
-                    zipfile.write(str(svg), basename(svg.name))
 
-            # Return zip file
-            with open(zip_file_name, 'rb') as f:
-                zip_file = f.read()
-                response = HttpResponse(zip_file, content_type='application/zip')
-                response['Content-Disposition'] = f'attachment; filename="{zip_name}"'
-                return response
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'created', 'finished', 'file']
+    list_filter = ['status']
+    readonly_fields = ['name', 'params', 'status', 'file', 'error', 'created', 'started', 'finished']
+
+    def has_add_permission(self, request):
+        return False
 
 
 @admin.register(Featured)
@@ -173,3 +181,9 @@ class FeaturedAdmin(SortableAdminMixin, admin.ModelAdmin):
     list_editable = ['tag']
     sortable_by = []
     save_on_top = True
+
+    def _update_order(self, updated_items, extra_model_filters):
+        # The drag and drop reordering is a `bulk_update`, without `post_save`
+        count = super()._update_order(updated_items, extra_model_filters)
+        catalog_services.bump_version()
+        return count
@@ -0,0 +1,44 @@
+from functools import reduce
+
+from django.db.models import Q
+
+
+def get_ordering(queryset):
+    """Return the ordering of `queryset` as a list of `(field name, descending)`, ending
+    with the primary key so every object has a unique position."""
+    query = queryset.query
+    if query.order_by:
+        order_by = query.order_by
+    elif query.default_ordering:
+        order_by = query.get_meta().ordering
+    else:
+        order_by = []
+
+    ordering = []
+    for field in order_by:
+        if not isinstance(field, str) or field == "?":
+            continue
+        descending = field.startswith("-")
+        ordering.append((field.lstrip("-"), descending))
+
+    pk_name = query.get_meta().pk.name
+    if not any(field in ("pk", pk_name) for field, _ in ordering):
+        ordering.append((pk_name, False))
+    return ordering
+
+
+def keyset_filter(ordering, values, after):
+    """Build the filter for the objects after (or before) the position `values`
+    in `ordering`: `a >= x AND ((a > x) OR (a = x AND b > y) OR ...)`."""
+    conditions = []
+    for index, (field, descending) in enumerate(ordering):
+        lookup = "lt" if descending == after else "gt"
+        condition = Q(**{f"{field}__{lookup}": values[field]})
+        for previous_field, _ in ordering[:index]:
+            condition &= Q(**{previous_field: values[previous_field]})
+        conditions.append(condition)
+
+    # The redundant bound over the first field lets the database use it as an index condition
+    field, descending = ordering[0]
+    bound = Q(**{f"{field}__{'lte' if descending == after else 'gte'}": values[field]})
+    return bound & reduce(lambda a, b: a | b, conditions)
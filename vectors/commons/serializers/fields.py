@@ -0,0 +1,30 @@
+from djangorestframework_camel_case.util import camel_to_underscore
+
+
+TRUE_VALUES = ("1", "true", "True", "yes")
+
+
+class DynamicFieldsSerializerMixin:
+    """Let the clients choose the serialized fields.
+    - `?fields=id,name`: only these fields (in camelCase or snake_case).
+    - `?lite=true`: only the fields in `lite_fields`.
+    """
+    lite_fields = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get("request", None)
+        if request is None:
+            return
+
+        fields = request.query_params.get("fields", None)
+        if fields:
+            allowed = {camel_to_underscore(field.strip()) for field in fields.split(",")}
+        elif self.lite_fields and request.query_params.get("lite", None) in TRUE_VALUES:
+            allowed = set(self.lite_fields)
+        else:
+            return
+
+        for field_name in set(self.fields) - allowed:
+            self.fields.pop(field_name)
@@ -1,65 +1,70 @@
 from collections import namedtuple
 
-from django.db import connection
-from django.core.exceptions import EmptyResultSet, ObjectDoesNotExist
+from django.core.exceptions import EmptyResultSet
+from django.db.models import IntegerField, Value
 
 from rest_framework import serializers
 
+from vectors.commons.keyset import get_ordering, keyset_filter
+
 
 Neighbor = namedtuple("Neighbor", "previous next")
 
 
-def get_neighbors(obj, queryset=None):
+def get_neighbors(obj, queryset=None, fields=("pk",)):
     """Get the neighbors of a model instance.
     The neighbors are the objects that are at the left/right of `obj` in the results set.
+    They are found with keyset filters over the ordering of the queryset, in one query.
     :param obj: The object you want to know its neighbors.
     :param queryset: Find the neighbors applying the constraints of this set (a Django queryset
         object).
+    :param fields: Fields loaded in the neighbors (the rest are deferred).
     :return: Tuple `<left neighbor>, <right neighbor>`. Previows and right neighbors can be `None`.
     """
+    queryset = queryset.prefetch_related(None)
+    ordering = get_ordering(queryset)
+    order_fields = [field for field, _ in ordering]
 
+    # Position of the object (the annotations, like `similarity`, are already in it)
     try:
-        base_sql, base_params = queryset.query.sql_with_params()
-    except EmptyResultSet:
-        return Neighbor(prev=None, next=None)
-
-    query = """
-        SELECT * FROM
-                (SELECT "id",
-                    ROW_NUMBER() OVER(),
-                    LAG("id", 1) OVER() AS prev,
-                    LEAD("id", 1) OVER() AS next
-                FROM (%s) as ID_AND_ROW)
-        AS SELECTED_ID_AND_ROW
-        """ % (
-        base_sql
-    )
-    query += " WHERE id=%s;"
-    params = list(base_params) + [obj.id]
-
-    cursor = connection.cursor()
-    cursor.execute(query, params)
-    sql_row_result = cursor.fetchone()
-
-    if sql_row_result is None:
-        return Neighbor(prev=None, next=None)
-
-    prev_object_id = sql_row_result[2]
-    next_object_id = sql_row_result[3]
+        values = {field: getattr(obj, field) for field in order_fields}
+    except AttributeError:
+        values = queryset.filter(pk=obj.pk).values(*order_fields).first()
+        if values is None:
+            return Neighbor(previous=None, next=None)
+
+    fields = list(fields)
+    previous_queryset = (
+        queryset
+        .filter(keyset_filter(ordering, values, after=False))
+        .order_by(*[field if descending else f"-{field}" for field, descending in ordering])
+        .values(*fields)
+        .annotate(neighbor=Value(-1, output_field=IntegerField()))
+    )[:1]
+    next_queryset = (
+        queryset
+        .filter(keyset_filter(ordering, values, after=True))
+        .order_by(*[f"-{field}" if descending else field for field, descending in ordering])
+        .values(*fields)
+        .annotate(neighbor=Value(1, output_field=IntegerField()))
+    )[:1]
 
     try:
-        previous = queryset.get(id=prev_object_id)
-    except ObjectDoesNotExist:
-        previous = None
-    try:
-        next = queryset.get(id=next_object_id)
-    except ObjectDoesNotExist:
-        next = None
+        rows = list(previous_queryset.union(next_queryset, all=True))
+    except EmptyResultSet:
+        return Neighbor(previous=None, next=None)
+
+    neighbors = {}
+    for row in rows:
+        direction = row.pop("neighbor")
+        neighbors[direction] = queryset.model(**row)
 
-    return Neighbor(previous=previous, next=next)
+    return Neighbor(previous=neighbors.get(-1), next=neighbors.get(1))
 
 
 class NeighborsSerializerMixin:
+    neighbor_fields = ("pk",)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["neighbors"] = serializers.SerializerMethodField("get_neighbors")
@@ -71,7 +76,7 @@ class NeighborsSerializerMixin:
         view, request = self.context.get("view", None), self.context.get("request", None)
         if view and request:
             queryset = view.filter_queryset(view.get_queryset())
-            previous, next = get_neighbors(obj, queryset)
+            previous, next = get_neighbors(obj, queryset, self.neighbor_fields)
         else:
             previous = next = None
 
@@ -0,0 +1,47 @@
+import hashlib
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from vectors.services import catalog as catalog_services
+
+
+def _catalog_etag(request, *args, **kwargs):
+    # The same url can be rendered in several formats (json, browsable api...)
+    resource = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return f"{catalog_services.get_version()}-{hashlib.md5(resource.encode('utf-8')).hexdigest()}"
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    return catalog_services.get_last_modified()
+
+
+def _has_shared_catalog_version():
+    # With a per-process cache each worker has its own catalog version, and a
+    # worker that didn't see a change would answer 304 with a stale ETag
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def catalog_condition(view):
+    """
+    Conditional GET (ETag / Last-Modified, 304 responses) for the views that only
+    depend on the catalog, validated against the catalog version. It's disabled
+    when the catalog version isn't shared by all the processes. The responses are
+    always revalidated, or browsers would guess a freshness from Last-Modified and
+    keep showing a stale catalog.
+    """
+    conditional_view = condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)(view)
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if _has_shared_catalog_version():
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, no_cache=True)
+            return response
+        return view(request, *args, **kwargs)
+
+    return inner
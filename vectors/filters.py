@@ -1,9 +1,24 @@
-from django.contrib.postgres.search import SearchQuery, SearchVector, SearchRank, TrigramWordSimilarity
-from django.db.models import Q
+from django.contrib.postgres.search import SearchQuery, TrigramWordSimilarity
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
 from vectors.models import Vector
 
 
+def filter_by_tag_names(queryset, tags):
+    """
+    Filter the vectors with all the tags named in `tags` (a list of names). The
+    special name `all` matches every vector.
+    """
+    if 'all' in tags:
+        return queryset.all()
+
+    for tag in tags:
+        queryset = queryset.filter(tags__name=tag)
+    return queryset
+
+
 class TagsFilter(filters.CharFilter):
     def filter(self, qs, value):
         if not value:
@@ -11,15 +26,10 @@ class TagsFilter(filters.CharFilter):
 
         tags = " ".join(value.split(','))
 
-        # Full Text Search by tags
-        return (
-            qs
-            .annotate(
-                search_a=SearchVector("search_text", config="simple_unaccent"),
-                search_b=SearchVector("search_text", config="english"),
-            )
-            .filter(Q(search_a=SearchQuery(tags, config="simple_unaccent")) | Q(search_b=SearchQuery(tags, config="english")))
-            .distinct()
+        # Full Text Search by tags (over the stored, GIN-indexed search vectors)
+        return qs.filter(
+            Q(search_vector_simple=SearchQuery(tags, config="simple_unaccent")) |
+            Q(search_vector_english=SearchQuery(tags, config="english"))
         )
 
 
@@ -30,12 +40,15 @@ class SimilarityFilter(filters.CharFilter):
 
         tags = " ".join(value.split(','))
 
-        # Search by similarity
+        # Search by similarity. The word similarity operator compares against the
+        # `pg_trgm.word_similarity_threshold` of the connection (see DATABASES in the
+        # settings) instead of a literal, that's what lets Postgres use the trigram index.
         return (
             qs
-            .annotate(similarity=TrigramWordSimilarity(tags, 'search_text'))
-            .filter(similarity__gt=0.35)
-            .order_by('-similarity', 'uploaded')
+            .filter(search_text__trigram_word_similar=tags)
+            # As a double, so the scores in the cursors (and the neighbors) match exactly
+            .annotate(similarity=Cast(TrigramWordSimilarity(tags, 'search_text'), FloatField()))
+            .order_by('-similarity', 'uploaded', 'id')
         )
 
 
@@ -46,3 +59,15 @@ class VectorsFilter(filters.FilterSet):
     class Meta:
         model = Vector
         fields = ["tags", "similarity"]
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    `OrderingFilter` that adds the `id` as the last ordering field, so objects with
+    the same values (i.e. the same `uploaded`) always come in the same order.
+    """
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering = [*ordering, '-id' if ordering[0].startswith('-') else 'id']
+        return ordering
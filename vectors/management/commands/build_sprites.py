@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from taggit.models import Tag
+
+from vectors.services import sprites as sprites_services
+
+
+class Command(BaseCommand):
+    help = ('Builds the cached svg sprites of every tag, with the original and the suggested colors. '
+            'Run it after the catalog changes (i.e. from cron) so the sprite endpoint is always warm')
+
+    def handle(self, *args, **options):
+        tag_names = Tag.objects.filter(vector__isnull=False).distinct().values_list('name', flat=True)
+
+        built = 0
+        for name in tag_names.iterator():
+            for suggested in (False, True):
+                if sprites_services.refresh_sprite([name], suggested) is not None:
+                    built += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully built {built} sprites!'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from vectors.models import Vector
+
+
+class Command(BaseCommand):
+    help = 'Generates the derived files of the vectors (like the svg templates, the recolored svgs and the thumbnails), for the ones uploaded before they existed'
+
+    def handle(self, *args, **options):
+        count = 0
+        for vector in Vector.objects.iterator():
+            vector.generate_files()
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully generated the files of {count} vectors!'))
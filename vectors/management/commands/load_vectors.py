@@ -1,33 +1,198 @@
 import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Lower
+from taggit.models import Tag, TaggedItem
+
+from vectors.models import Vector, render_thumbnail, update_search_text
+from vectors.services import batching
+from vectors.services import catalog as catalog_services
+from vectors.services import render_cache
+from vectors.services import svg_templates
+
+
+def parse_tags(file_name):
+    if file_name.find('-') > -1:
+        tags_str = file_name[:file_name.find('-')]
+    else:
+        tags_str = file_name[:file_name.find('.')]
+
+    return tags_str.split('_')
 
-from vectors.models import Vector
 
 class Command(BaseCommand):
     help = 'Loads vectors from a specific directory. Files must have the schema: tag1_tag2.svg or tag1_tag2-1.svg'
 
     def add_arguments(self, parser):
         parser.add_argument('source_dir')
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help=('Load the vectors in batches, with bulk inserts and parallel file copies. '
+                  'Files already loaded (with the same content) are skipped, so it can be resumed. '
+                  'The svg templates and the thumbnails are generated too')
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Vectors per batch (with --bulk)')
+        parser.add_argument('--workers', type=int, default=8, help='Threads copying the files (with --bulk)')
 
     def handle(self, *args, **options):
         source_dir = options['source_dir']
+        source_vectors = sorted(pathlib.Path(source_dir).glob('*.svg'))
 
-        for source_vector in pathlib.Path(source_dir).glob('*.svg'):
-            file_name = source_vector.name
-            if file_name.find('-') > -1:
-                tags_str = file_name[:file_name.find('-')]
-            else:
-                tags_str = file_name[:file_name.find('.')]
+        if options['bulk']:
+            if options['batch_size'] < 1 or options['workers'] < 1:
+                raise CommandError('batch-size and workers must be positive numbers')
+            self.bulk_load(source_vectors, options['batch_size'], options['workers'])
+            return
 
-            tags = tags_str.split('_')
+        # The search texts, the catalog and the derived files are updated once, at the end
+        with batching.batch():
+            for source_vector in source_vectors:
+                file_name = source_vector.name
+                tags = parse_tags(file_name)
 
-            vector = Vector(name=file_name)
-            with open(source_vector, 'rb') as f:
-                content = File(f)
-                vector.svg.save(file_name, content, save=True)
+                vector = Vector(name=file_name)
+                with open(source_vector, 'rb') as f:
+                    content = File(f)
+                    vector.svg.save(file_name, content, save=True)
 
-            vector.tags.add(*tags)
+                vector.tags.add(*tags)
 
         self.stdout.write(self.style.SUCCESS('Successfully loaded vectors!'))
+
+    ##################################################################
+    # BULK LOAD
+    ##################################################################
+
+    def bulk_load(self, source_vectors, batch_size, workers):
+        start = time.monotonic()
+        loaded = skipped = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            self.hash_vectors(executor)
+
+            for i in range(0, len(source_vectors), batch_size):
+                batch = source_vectors[i:i + batch_size]
+                batch_loaded = self.load_batch(batch, executor)
+                loaded += batch_loaded
+                skipped += len(batch) - batch_loaded
+
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f'{i + len(batch)}/{len(source_vectors)} files, {loaded} loaded, {skipped} skipped '
+                    f'({loaded / elapsed:.1f} vectors/s)'
+                )
+
+        if loaded:
+            catalog_services.bump_version()
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully loaded {loaded} vectors ({skipped} skipped) '
+            f'in {elapsed:.1f}s, {loaded / elapsed if elapsed else 0:.1f} vectors/s!'
+        ))
+
+    def hash_vectors(self, executor):
+        """
+        Store the content hash of the vectors without one (loaded before it existed,
+        or whose files weren't generated yet), so their files are skipped too.
+        """
+        vectors = list(Vector.objects.filter(content_hash__isnull=True).exclude(svg='').only('id', 'svg'))
+
+        def get_hash(vector):
+            try:
+                return render_cache.source_hash(vector.svg.path)
+            except FileNotFoundError:
+                return None
+
+        for vector, content_hash in zip(vectors, executor.map(get_hash, vectors)):
+            vector.content_hash = content_hash
+        Vector.objects.bulk_update([vector for vector in vectors if vector.content_hash], ['content_hash'], batch_size=1000)
+
+    def load_batch(self, batch, executor):
+        # Skip the files already loaded, by their content
+        hashes = list(executor.map(lambda path: render_cache.source_hash(str(path)), batch))
+        loaded_hashes = set(Vector.objects.filter(content_hash__in=hashes).values_list('content_hash', flat=True))
+
+        sources = {}
+        for path, content_hash in zip(batch, hashes):
+            if content_hash not in loaded_hashes and content_hash not in sources:
+                sources[content_hash] = path
+        if not sources:
+            return 0
+
+        # Copy the files and compute their templates and thumbnails
+        thumbnail_field = Vector._meta.get_field('svg_thumbnail')
+
+        def copy(path):
+            with open(path, 'rb') as f:
+                name = default_storage.save(path.name, File(f))
+            thumbnail = render_thumbnail(default_storage.path(name))
+            if thumbnail is not None:
+                thumbnail = default_storage.save(
+                    thumbnail_field.generate_filename(None, path.name.replace('.svg', '.png')),
+                    ContentFile(thumbnail)
+                )
+            return name, svg_templates.get_template(default_storage.path(name)).to_dict(), thumbnail
+
+        copies = list(executor.map(copy, sources.values()))
+
+        try:
+            with transaction.atomic():
+                self.create_vectors(list(zip(sources.keys(), sources.values(), copies)))
+        except Exception:
+            for name, _, thumbnail in copies:
+                default_storage.delete(name)
+                if thumbnail:
+                    default_storage.delete(thumbnail)
+            raise
+
+        return len(sources)
+
+    def create_vectors(self, sources):
+        # In file order, so the first spelling of a new tag is the one kept (like in a sequential load)
+        tags = self.get_tags(list(dict.fromkeys(name for _, path, _ in sources for name in parse_tags(path.name))))
+
+        vectors = []
+        vector_tags = []
+        for content_hash, path, (name, svg_template, thumbnail) in sources:
+            vector_tags.append(list(dict.fromkeys(tags[tag.lower()] for tag in parse_tags(path.name))))
+            vectors.append(Vector(
+                name=path.name,
+                svg=name,
+                content_hash=content_hash,
+                svg_template=svg_template,
+                svg_thumbnail=thumbnail,
+            ))
+
+        vectors = Vector.objects.bulk_create(vectors)
+
+        content_type = ContentType.objects.get_for_model(Vector)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type=content_type, object_id=vector.id, tag=tag)
+            for vector, tag_list in zip(vectors, vector_tags)
+            for tag in tag_list
+        ])
+
+        # Search texts of the whole batch, in one update
+        update_search_text([vector.id for vector in vectors])
+
+    def get_tags(self, names):
+        """
+        Return a dict of lowercased name => Tag for `names`, creating the missing ones
+        (tags are case insensitive, like in `vector.tags.add()`).
+        """
+        tags = {}
+        for tag in Tag.objects.annotate(lower_name=Lower('name')).filter(lower_name__in={n.lower() for n in names}):
+            tags.setdefault(tag.lower_name, tag)
+
+        for name in names:
+            if name.lower() not in tags:
+                tags[name.lower()], _ = Tag.objects.get_or_create(name__iexact=name, defaults={'name': name})
+        return tags
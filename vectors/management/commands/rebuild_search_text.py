@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vectors.models import update_search_text
+from vectors.services import catalog as catalog_services
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search text and the search vectors of all the vectors from their tags, in one statement'
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        count = update_search_text()
+        catalog_services.bump_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully rebuilt the search text of {count} vectors in {time.monotonic() - start:.1f}s!'
+        ))
@@ -0,0 +1,25 @@
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from vectors.services import featured as featured_services
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the cached payloads of the featured endpoint with new random vectors. '
+            'Run it periodically (i.e. from cron) to keep them fresh')
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Public url of the api, i.e. https://cocomaterial.com')
+
+    def handle(self, *args, **options):
+        base_url = urlparse(options['base_url'])
+        request = RequestFactory().get(
+            '/api/vectors/featured/',
+            secure=base_url.scheme == 'https',
+            HTTP_HOST=base_url.netloc,
+        )
+        featured_services.refresh_payloads(request)
+
+        self.stdout.write(self.style.SUCCESS('Successfully refreshed the featured payloads!'))
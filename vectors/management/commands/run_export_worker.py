@@ -0,0 +1,79 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from vectors.services import exports as exports_services
+
+
+# Seconds between the deletions of the expired exports, while the queue is empty
+CLEANUP_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = ('Makes the exports queued by the api and the admin, with several workers in parallel, '
+            'and deletes the expired ones. Run it as a service, next to the web server')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.EXPORT_WORKERS,
+            help='Exports made at the same time (each one in its own thread)'
+        )
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        workers, once = options['workers'], options['once']
+        if workers < 1:
+            raise CommandError('workers must be a positive number')
+
+        self.cleanup_lock = threading.Lock()
+        self.next_cleanup = 0
+
+        # With only one worker, work in this thread
+        if workers == 1:
+            self.work(once)
+            return
+
+        threads = [
+            threading.Thread(target=self.work_in_thread, args=(once,), daemon=True)
+            for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def work_in_thread(self, once):
+        try:
+            self.work(once)
+        finally:
+            connection.close()
+
+    def work(self, once):
+        while True:
+            job = exports_services.claim_job()
+            if job is None:
+                self.clean_up()
+                if once:
+                    return
+                time.sleep(settings.EXPORT_POLL_INTERVAL)
+                continue
+
+            exports_services.run_job(job)
+            if job.status == job.Status.DONE:
+                self.stdout.write(self.style.SUCCESS(f'Export {job.id} ({job.name}) done'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Export {job.id} ({job.name}) failed: {job.error}'))
+
+    def clean_up(self):
+        # Only one of the workers, once every CLEANUP_INTERVAL seconds
+        with self.cleanup_lock:
+            if time.monotonic() < self.next_cleanup:
+                return
+            self.next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+
+        deleted = exports_services.delete_expired_jobs()
+        if deleted:
+            self.stdout.write(f'{deleted} expired exports deleted')
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:11
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0018_alter_vector_colored_gif_alter_vector_colored_svg_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vector',
+            name='search_vector_english',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='vector',
+            name='search_vector_simple',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE vectors_vector
+               SET search_vector_simple = to_tsvector('simple_unaccent', COALESCE(search_text, '')),
+                   search_vector_english = to_tsvector('english', COALESCE(search_text, ''));
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='vector',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector_simple'], name='vector_search_simple_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='vector',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector_english'], name='vector_search_english_gin'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:12
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0019_vector_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vector',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_text'], name='vector_search_text_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0020_vector_search_text_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vector',
+            name='generated_colored_svg',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='generated/'),
+        ),
+    ]
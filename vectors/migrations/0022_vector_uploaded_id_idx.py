@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0021_vector_generated_colored_svg'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vector',
+            index=models.Index(fields=['uploaded', 'id'], name='vector_uploaded_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0022_vector_uploaded_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vector',
+            name='svg_template',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0023_vector_svg_template'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vector',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+    ]
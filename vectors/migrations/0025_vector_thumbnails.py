@@ -0,0 +1,23 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0024_vector_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vector',
+            name='colored_svg_thumbnail',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='vector',
+            name='svg_thumbnail',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectors', '0026_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='catalog_version',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -1,9 +1,17 @@
+import hashlib
 import os
-from xml.dom import minidom
-
+import random
+import uuid
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models
+from django.db.models import Q, QuerySet
 from django.db.models.constraints import CheckConstraint
 from constrainedfilefield.fields import ConstrainedFileField
 from django.dispatch import receiver
@@ -11,6 +19,13 @@ from django.utils.functional import cached_property
 
 from colorfield.fields import ColorField
 from taggit.managers import TaggableManager
+from taggit.models import Tag, TaggedItem
+
+from vectors.services import batching
+from vectors.services import catalog as catalog_services
+from vectors.services import images as images_services
+from vectors.services import render_cache
+from vectors.services import svg_templates
 
 
 class Vector(models.Model):
@@ -20,12 +35,19 @@ class Vector(models.Model):
     tags = TaggableManager()
     uploaded = models.DateTimeField(auto_now_add=True)
     search_text = models.TextField(null=True, blank=True)
+    search_vector_simple = SearchVectorField(null=True, blank=True, editable=False)
+    search_vector_english = SearchVectorField(null=True, blank=True, editable=False)
 
     # SVG files
     svg = ConstrainedFileField(blank=True, null=True, content_types=['image/svg+xml'])
     colored_svg = ConstrainedFileField(blank=True, null=True, content_types=['image/svg+xml'])
     stroke_color = ColorField(blank=True, null=True)
     fill_color = ColorField(blank=True, null=True)
+    generated_colored_svg = models.FileField(blank=True, null=True, editable=False, upload_to='generated/')
+    svg_template = models.JSONField(blank=True, null=True, editable=False)
+    svg_thumbnail = models.FileField(blank=True, null=True, editable=False, upload_to='thumbnails/')
+    colored_svg_thumbnail = models.FileField(blank=True, null=True, editable=False, upload_to='thumbnails/')
+    content_hash = models.CharField(max_length=64, blank=True, null=True, editable=False, db_index=True)
 
     # GIF files
     gif = ConstrainedFileField(blank=True, null=True, content_types=['image/gif'])
@@ -44,12 +66,49 @@ class Vector(models.Model):
                 name='vector_should_have_some_file'
             )
         ]
+        indexes = [
+            GinIndex(fields=["search_vector_simple"], name="vector_search_simple_gin"),
+            GinIndex(fields=["search_vector_english"], name="vector_search_english_gin"),
+            GinIndex(fields=["search_text"], name="vector_search_text_trgm", opclasses=["gin_trgm_ops"]),
+            models.Index(fields=["uploaded", "id"], name="vector_uploaded_id_idx"),
+        ]
 
     def __str__(self):
         return self.description
 
     @cached_property
     def svg_content(self):
+        return caches['contents'].get_or_set(
+            self._content_cache_key('svg_content'),
+            self._read_svg_content,
+            settings.VECTOR_CONTENT_CACHE_TIMEOUT
+        )
+
+    @cached_property
+    def colored_svg_content(self):
+        return caches['contents'].get_or_set(
+            self._content_cache_key('colored_svg_content'),
+            self._read_colored_svg_content,
+            settings.VECTOR_CONTENT_CACHE_TIMEOUT
+        )
+
+    def _content_cache_key(self, name):
+        # The key changes with the files (their names and the hash of the svg) and
+        # the colors, so an outdated content can't be served even if it's cached
+        # between the `pre_save` and the save, or by another process.
+        fingerprint = (
+            f"{self.svg.name}|{self.content_hash}|{self.colored_svg.name}|{self.generated_colored_svg.name}|"
+            f"{self.stroke_color}|{self.fill_color}"
+        )
+        return f"vectors:{name}:{self.id}:{hashlib.md5(fingerprint.encode('utf-8')).hexdigest()}"
+
+    def clear_content_cache(self):
+        caches['contents'].delete_many([
+            self._content_cache_key('svg_content'),
+            self._content_cache_key('colored_svg_content'),
+        ])
+
+    def _read_svg_content(self):
         if self.svg:
             try:
                 with open(self.svg.path, 'r') as f:
@@ -60,8 +119,7 @@ class Vector(models.Model):
 
         return ""
 
-    @cached_property
-    def colored_svg_content(self):
+    def _read_colored_svg_content(self):
         if self.colored_svg:
             try:
                 with open(self.colored_svg.path, 'r') as f:
@@ -71,32 +129,198 @@ class Vector(models.Model):
                 pass
 
         elif self.stroke_color or self.fill_color:
-            new_stroke = self.stroke_color or "#000"
-            new_fill = self.fill_color  or "#fff"
+            if self.generated_colored_svg:
+                try:
+                    with open(self.generated_colored_svg.path, 'r') as f:
+                        text = f.read()
+                        return text
+                except FileNotFoundError:
+                    pass
+
+            # Not generated yet (i.e. vectors saved before it was stored, until
+            # `generate_vector_files` is run), recolor it on read
+            if self.svg:
+                return self._recolor_svg() or ""
+
+        return ""
 
+    def _recolor_svg(self):
+        new_stroke = self.stroke_color or "#000"
+        new_fill = self.fill_color  or "#fff"
+
+        try:
+            template = self.get_svg_template()
+        except FileNotFoundError:
+            return None
+
+        return template.render(
+            f'{new_stroke}'.replace('#none', 'none'),
+            f'{new_fill}'.replace('#none', 'none'),
+        )
+
+    def get_svg_template(self):
+        """
+        Return the `SvgTemplate` of the svg, the stored one if there is one.
+        """
+        if self.svg_template:
+            return svg_templates.SvgTemplate.from_dict(self.svg_template)
+        return svg_templates.get_template(self.svg.path)
+
+    def generate_svg_template(self):
+        """
+        Store the `SvgTemplate` of the svg, so it can be recolored without parsing it.
+        """
+        svg_template = None
+        if self.svg:
             try:
-                with minidom.parse(self.svg.path) as dom:
-                    paths = dom.getElementsByTagName('path')
-                    for path in paths:
-                        fill = path.getAttribute('fill')
-                        if fill in ['#030303', '#000000', '#000', "", None]: # black color
-                            fill = f'{new_stroke}'.replace('#none', 'none')
-                        else: # fill == fff | ffffff
-                            fill = f'{new_fill}'.replace('#none', 'none')
-                        path.setAttribute('fill', fill)
-                    return dom.toxml()
+                svg_template = svg_templates.get_template(self.svg.path).to_dict()
             except FileNotFoundError:
                 pass
 
-        return ""
+        if svg_template != self.svg_template:
+            self.svg_template = svg_template
+            Vector.objects.filter(id=self.id).update(svg_template=svg_template)
+
+    def generate_content_hash(self):
+        """
+        Store the sha256 of the svg, to know if a file is already loaded.
+        """
+        content_hash = None
+        if self.svg:
+            try:
+                content_hash = render_cache.source_hash(self.svg.path)
+            except FileNotFoundError:
+                pass
+
+        if content_hash != self.content_hash:
+            self.content_hash = content_hash
+            Vector.objects.filter(id=self.id).update(content_hash=content_hash)
+
+    def generate_colored_svg(self):
+        """
+        Store the svg recolored with `stroke_color` / `fill_color`, for the vectors
+        without a `colored_svg`, so it isn't computed every time it's read.
+        """
+        old_generated_colored_svg = self.generated_colored_svg.name
+
+        content = None
+        if self.svg and not self.colored_svg and (self.stroke_color or self.fill_color):
+            content = self._recolor_svg()
+
+        if content is not None:
+            self.generated_colored_svg.save(
+                os.path.basename(self.svg.name),
+                ContentFile(content.encode('utf-8')),
+                save=False
+            )
+        else:
+            self.generated_colored_svg = None
+
+        if self.generated_colored_svg.name != old_generated_colored_svg:
+            (Vector.objects
+                .filter(id=self.id)
+                .update(generated_colored_svg=self.generated_colored_svg.name))
+
+        if old_generated_colored_svg and old_generated_colored_svg != self.generated_colored_svg.name:
+            default_storage.delete(old_generated_colored_svg)
+
+    def _generate_thumbnail(self, field_name, svg):
+        thumbnail = getattr(self, field_name)
+        old_thumbnail = thumbnail.name
+
+        content = render_thumbnail(svg.path) if svg else None
+        if content is not None:
+            thumbnail.save(
+                os.path.basename(svg.name).replace('.svg', '.png'),
+                ContentFile(content),
+                save=False
+            )
+        else:
+            setattr(self, field_name, None)
+            thumbnail = getattr(self, field_name)
+
+        if thumbnail.name != old_thumbnail:
+            Vector.objects.filter(id=self.id).update(**{field_name: thumbnail.name})
+
+        if old_thumbnail and old_thumbnail != thumbnail.name:
+            default_storage.delete(old_thumbnail)
+
+    def generate_thumbnails(self):
+        """
+        Store the PNG thumbnails (THUMBNAIL_SIZE px) of the svg and the colored svg,
+        for the admin lists.
+        """
+        self._generate_thumbnail('svg_thumbnail', self.svg)
+        self._generate_thumbnail('colored_svg_thumbnail', self.colored_svg or self.generated_colored_svg)
 
     def recalculate_search_text(self):
-        (Vector.objects
-            .filter(id=self.id)
-            .update(search_text=" ".join(self.tags.names())))
+        batching.run_for(update_search_text, self.id)
+
+    def generate_files(self):
+        self.generate_content_hash()
+        self.generate_svg_template()
+        self.generate_colored_svg()
+        self.generate_thumbnails()
+
+
+def update_search_text(vector_ids=None):
+    """
+    Update the search text (the names of the tags, in the order they were added) and
+    the search vectors of the vectors in `vector_ids` (all of them if it's `None`),
+    in one statement. Return the number of updated vectors.
+
+    `vector_ids` can be a queryset of vectors, it's used as a subquery.
+    """
+    where, params = "", [ContentType.objects.get_for_model(Vector).id]
+    if isinstance(vector_ids, QuerySet):
+        sql, query_params = vector_ids.order_by().values('id').query.sql_with_params()
+        where = f"WHERE vector.id IN ({sql})"
+        params.extend(query_params)
+    elif vector_ids is not None:
+        where = "WHERE vector.id = ANY(%s)"
+        params.append(list(vector_ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {Vector._meta.db_table} AS vector
+            SET search_text = tags.search_text,
+                search_vector_simple = to_tsvector('simple_unaccent', tags.search_text),
+                search_vector_english = to_tsvector('english', tags.search_text)
+            FROM (
+                SELECT vector.id, COALESCE(string_agg(tag.name, ' ' ORDER BY item.id), '') AS search_text
+                FROM {Vector._meta.db_table} AS vector
+                LEFT JOIN {TaggedItem._meta.db_table} AS item
+                    ON item.object_id = vector.id AND item.content_type_id = %s
+                LEFT JOIN {Tag._meta.db_table} AS tag ON tag.id = item.tag_id
+                {where}
+                GROUP BY vector.id
+            ) AS tags
+            WHERE vector.id = tags.id
+        """, params)
+        return cursor.rowcount
+
+
+def generate_files(vectors):
+    for vector in vectors:
+        vector.generate_files()
+
+
+def render_thumbnail(path):
+    """
+    Return the PNG thumbnail (THUMBNAIL_SIZE px) of the svg file in `path`, or
+    `None` if it can't be rasterized.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return images_services.svg_to_png(f.read(), settings.THUMBNAIL_SIZE)
+    except (OSError, ValueError, TypeError, SyntaxError):
+        # Svgs without a valid size can't be rasterized, the admin shows the svg instead
+        return None
 
 
 class Featured(models.Model):
+    SAMPLE_SIZE = 12
+
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, blank=False, null=False)
     tag = models.CharField(max_length=100, blank=True, null=True)
@@ -104,10 +328,31 @@ class Featured(models.Model):
 
     @property
     def vectors(self):
-        vectors = Vector.objects.all()
-        if self.tag:
-            vectors = vectors.filter(tags__name=self.tag)
-        return vectors.order_by('?')[0:12]
+        # Pick the sample from the cached ids instead of sorting all the
+        # vectors with `order_by('?')` on every request
+        vector_ids = self.vector_ids()
+        sample = random.sample(vector_ids, min(self.SAMPLE_SIZE, len(vector_ids)))
+
+        vectors = Vector.objects.filter(id__in=sample).defer('svg_template').prefetch_related('tags')
+        return sorted(vectors, key=lambda vector: sample.index(vector.id))
+
+    def vector_ids(self):
+        """
+        Return the ids of all the vectors of this block. They are cached for
+        FEATURED_IDS_CACHE_TIMEOUT seconds.
+        """
+        def get_vector_ids():
+            vectors = Vector.objects.all()
+            if self.tag:
+                vectors = vectors.filter(tags__name=self.tag)
+            return list(vectors.values_list('id', flat=True))
+
+        tag_hash = hashlib.md5((self.tag or "").encode('utf-8')).hexdigest()
+        return cache.get_or_set(
+            f"featured:vector_ids:{catalog_services.get_version()}:{tag_hash}",
+            get_vector_ids,
+            settings.FEATURED_IDS_CACHE_TIMEOUT
+        )
 
     class Meta:
         ordering = ["order"]
@@ -116,17 +361,66 @@ class Featured(models.Model):
         return f"{self.name} ({self.tag or ''})"
 
 
+class ExportJob(models.Model):
+    """
+    A bulk download to be zipped in the background by the `run_export_worker` command.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255)
+    params = models.JSONField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    file = models.FileField(blank=True, null=True, upload_to='exports/')
+    error = models.TextField(blank=True, default='')
+    # Catalog version when it was requested, the export is reused until the catalog changes
+    catalog_version = models.CharField(max_length=32, blank=True, default='', editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["status", "created"], name="exportjob_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
 ##################################################################
 # SIGNALS
 ##################################################################
 
 @receiver(models.signals.m2m_changed, sender=Vector.tags.through)
 def auto_generate_search_data(sender, instance, action, **kwargs):
-    instance.recalculate_search_text()
+    if action.startswith('post_'):
+        instance.recalculate_search_text()
+
+
+@receiver(models.signals.post_save, sender=Vector)
+@receiver(models.signals.post_delete, sender=Vector)
+@receiver(models.signals.m2m_changed, sender=Vector.tags.through)
+@receiver(models.signals.post_save, sender=Featured)
+@receiver(models.signals.post_delete, sender=Featured)
+@receiver(models.signals.post_save, sender=Tag)
+@receiver(models.signals.post_delete, sender=Tag)
+def auto_bump_catalog_version(sender, **kwargs):
+    if kwargs.get('action', '').startswith('pre_'):
+        return
+
+    batching.run(catalog_services.bump_version)
 
 
 @receiver(models.signals.post_delete, sender=Vector)
 def auto_delete_svg_on_deletion(sender, instance, **kwargs):
+    instance.clear_content_cache()
+
     # SVG files
     if instance.svg and os.path.isfile(instance.svg.path):
         default_storage.delete(instance.svg.path)
@@ -134,6 +428,15 @@ def auto_delete_svg_on_deletion(sender, instance, **kwargs):
     if instance.colored_svg and os.path.isfile(instance.colored_svg.path):
         default_storage.delete(instance.colored_svg.path)
 
+    if instance.generated_colored_svg and os.path.isfile(instance.generated_colored_svg.path):
+        default_storage.delete(instance.generated_colored_svg.path)
+
+    if instance.svg_thumbnail and os.path.isfile(instance.svg_thumbnail.path):
+        default_storage.delete(instance.svg_thumbnail.path)
+
+    if instance.colored_svg_thumbnail and os.path.isfile(instance.colored_svg_thumbnail.path):
+        default_storage.delete(instance.colored_svg_thumbnail.path)
+
     # GIF files
     if instance.gif and os.path.isfile(instance.gif.path):
         default_storage.delete(instance.gif.path)
@@ -142,6 +445,18 @@ def auto_delete_svg_on_deletion(sender, instance, **kwargs):
         default_storage.delete(instance.colored_gif.path)
 
 
+@receiver(models.signals.post_delete, sender=ExportJob)
+def auto_delete_export_on_deletion(sender, instance, **kwargs):
+    if instance.file and os.path.isfile(instance.file.path):
+        default_storage.delete(instance.file.path)
+
+
+def _file_changed(old_file, new_file):
+    # A new upload isn't saved (nor renamed) until after `pre_save`, so it can
+    # have the same name as the old file
+    return old_file != new_file or bool(new_file and not new_file._committed)
+
+
 @receiver(models.signals.pre_save, sender=Vector)
 def auto_delete_file_on_update(sender, instance, **kwargs):
     if not instance.pk:
@@ -152,24 +467,45 @@ def auto_delete_file_on_update(sender, instance, **kwargs):
     except Vector.DoesNotExist:
         return False
 
+    old_vector.clear_content_cache()
+
     # Svg files
     old_svg = old_vector.svg
     new_svg = instance.svg
-    if old_svg and old_svg != new_svg and os.path.isfile(old_svg.path):
+    svg_changed = _file_changed(old_svg, new_svg)
+    if old_svg and svg_changed and os.path.isfile(old_svg.path):
         default_storage.delete(old_svg.path)
 
     old_colored_svg = old_vector.colored_svg
     new_colored_svg = instance.colored_svg
-    if old_colored_svg and old_colored_svg != new_colored_svg and os.path.isfile(old_colored_svg.path):
+    colored_svg_changed = _file_changed(old_colored_svg, new_colored_svg)
+    if old_colored_svg and colored_svg_changed and os.path.isfile(old_colored_svg.path):
         default_storage.delete(old_colored_svg.path)
 
+    # Generated files are outdated if any of their sources have changed
+    instance._generated_files_outdated = (
+        svg_changed or
+        colored_svg_changed or
+        old_vector.stroke_color != instance.stroke_color or
+        old_vector.fill_color != instance.fill_color
+    )
+
     # Gif files
     old_gif = old_vector.gif
     new_gif = instance.gif
-    if old_gif and old_gif != new_gif and os.path.isfile(old_gif.path):
+    if old_gif and _file_changed(old_gif, new_gif) and os.path.isfile(old_gif.path):
         default_storage.delete(old_gif.path)
 
     old_colored_gif = old_vector.colored_gif
     new_colored_gif = instance.colored_gif
-    if old_colored_gif and old_colored_gif != new_colored_gif and os.path.isfile(old_colored_gif.path):
+    if old_colored_gif and _file_changed(old_colored_gif, new_colored_gif) and os.path.isfile(old_colored_gif.path):
         default_storage.delete(old_colored_gif.path)
+
+
+@receiver(models.signals.post_save, sender=Vector)
+def auto_generate_files_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+
+    if created or getattr(instance, '_generated_files_outdated', False):
+        batching.run_for(generate_files, instance)
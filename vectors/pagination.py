@@ -1,7 +1,135 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import hashlib
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+from vectors.commons.keyset import get_ordering, keyset_filter
+from vectors.services import catalog as catalog_services
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that caches the count of each query for COUNT_CACHE_TIMEOUT seconds,
+    or until the catalog changes.
+    """
+    @cached_property
+    def count(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        query_hash = hashlib.md5(f"{sql}|{params}".encode('utf-8')).hexdigest()
+        key = f"count:{catalog_services.get_version()}:{query_hash}"
+        return cache.get_or_set(key, lambda: super(CachedCountPaginator, self).count, settings.COUNT_CACHE_TIMEOUT)
 
 
 class StandardResultsSetPagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CursorResultsSetPagination(CursorPagination):
+    """
+    Keyset pagination, for infinite scroll clients (`?pagination=cursor`). Pages cost
+    the same at any depth and there is no count query.
+
+    The cursor is the position (the values of all the ordering fields, ending with
+    the id) of the last item of the page, so pages follow the ordering of the
+    queryset (i.e. the `?ordering=` param, or the similarity score) without offsets,
+    even with many ties.
+    """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = ('-uploaded', '-id')
+
+    def get_keyset_ordering(self, queryset):
+        # The queryset ordering (set by the filters), the newest vectors first otherwise
+        if not queryset.query.order_by:
+            queryset = queryset.order_by(*self.ordering)
+        return get_ordering(queryset)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.keyset_ordering = self.get_keyset_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+
+        if position is not None:
+            try:
+                queryset = queryset.filter(keyset_filter(self.keyset_ordering, position, after=not reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        queryset = queryset.order_by(*[
+            f"-{field}" if descending != reverse else field
+            for field, descending in self.keyset_ordering
+        ])
+
+        # One more item to know if there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def _position(self, item):
+        position = {}
+        for field, _ in self.keyset_ordering:
+            value = getattr(item, field)
+            position[field] = value.isoformat() if isinstance(value, datetime) else value
+        return position
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'p': [position[field] for field, _ in self.keyset_ordering], 'r': int(reverse)})
+        cursor = b64encode(data.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """
+        Return the position and the direction (`True` backwards) of the cursor of
+        `request`, `(None, False)` without a cursor.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            data = json.loads(b64decode(cursor.encode('ascii'), validate=True))
+            values, reverse = data['p'], bool(data['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(values, list) or len(values) != len(self.keyset_ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return dict(zip([field for field, _ in self.keyset_ordering], values)), reverse
@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from taggit.models import Tag
 
+from vectors.commons.serializers.fields import DynamicFieldsSerializerMixin
 from vectors.commons.serializers.neighbors import NeighborsSerializerMixin
-from vectors.models import Vector, Featured
+from vectors.models import ExportJob, Vector, Featured
 
 ###################################################
 # Tag
@@ -18,7 +19,8 @@ class TagSerializer(serializers.ListField):
     tag = serializers.CharField()
 
     def to_representation(self, data):
-        return ','.join(data.values_list('name', flat=True))
+        # NOTE: use `all()` so prefetched tags don't need a query per vector
+        return ','.join(tag.name for tag in data.all())
 
 
 ###################################################
@@ -32,19 +34,35 @@ class _NeighborVectorSerializer(serializers.HyperlinkedModelSerializer):
         depth = 0
 
 
-class VectorSerializer(serializers.HyperlinkedModelSerializer):
+class VectorSerializer(DynamicFieldsSerializerMixin, serializers.HyperlinkedModelSerializer):
     tags = TagSerializer()
 
+    # Without the svg contents, for grids that load them lazily
+    lite_fields = (
+        'id', 'url', 'name', 'tags',
+        'svg', 'colored_svg', 'generated_colored_svg',
+        'gif', 'colored_gif',
+    )
+
     class Meta:
         model = Vector
         fields = (
             'id', 'url', 'name', 'tags',
-            'svg', 'svg_content', 'colored_svg', 'colored_svg_content', 'stroke_color', 'fill_color',
+            'svg', 'svg_content', 'colored_svg', 'colored_svg_content', 'generated_colored_svg',
+            'stroke_color', 'fill_color',
             'gif', 'colored_gif',
         )
 
 
+class VectorContentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Vector
+        fields = ('id', 'svg_content', 'colored_svg_content')
+
+
 class VectorWithNeighborsSerializer(NeighborsSerializerMixin, VectorSerializer):
+    neighbor_fields = ("id", "name")
+
     def serialize_neighbor(self, neighbor):
         return _NeighborVectorSerializer(neighbor, context=self.context).data
 
@@ -61,6 +79,17 @@ class FeaturedSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+###################################################
+# Export
+###################################################
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'name', 'status', 'error', 'file', 'created', 'started', 'finished')
+        read_only_fields = fields
+
+
 ###################################################
 # Suggestion
 ###################################################
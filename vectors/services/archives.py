@@ -0,0 +1,36 @@
+import io
+from zipfile import ZipFile
+
+
+class _ZipStream(io.RawIOBase):
+    """
+    Write-only, non seekable buffer. `ZipFile` falls back to data descriptors
+    when it can't seek, so each entry can be flushed as soon as it's written.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """
+    Generate a zip archive chunk by chunk from an iterable of `(name, content)`,
+    so only one file has to be held in memory at a time.
+    """
+    stream = _ZipStream()
+    with ZipFile(stream, 'w') as zipfile:
+        for name, content in files:
+            zipfile.writestr(name, content)
+            yield stream.pop()
+    yield stream.pop()
@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+
+# func => {item: item} of the work deferred by the current batch (None out of a batch)
+_deferred = ContextVar('vectors_batch', default=None)
+
+
+@contextmanager
+def batch():
+    """
+    Run the block in a transaction, deferring the work queued with `run` / `run_for`
+    (like the search text, the catalog version or the derived files of the vectors)
+    until it's committed, so it's done once for all the changed vectors instead of
+    once for every change. Nested batches join the outer one.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+
+    deferred = {}
+    token = _deferred.set(deferred)
+    try:
+        with transaction.atomic():
+            yield
+    finally:
+        _deferred.reset(token)
+
+    # Out of the batch, so the deferred work runs right away (after the commit of
+    # the outer transaction, if there is one)
+    transaction.on_commit(lambda: _flush(deferred))
+
+
+def _flush(deferred):
+    # The work on the items first, so the work without items (like bumping the
+    # catalog version) runs when all the changes are done
+    for func, items in deferred.items():
+        if items:
+            func(list(items.values()))
+    for func, items in deferred.items():
+        if not items:
+            func()
+
+
+def run(func):
+    """
+    Call `func()` now or, inside a batch, once when the batch is committed, after
+    the work queued with `run_for`.
+    """
+    deferred = _deferred.get()
+    if deferred is None:
+        func()
+    else:
+        deferred.setdefault(func, {})
+
+
+def run_for(func, item):
+    """
+    Call `func([item])` now or, inside a batch, `func(items)` once when the batch
+    is committed, with all the items queued for `func` (the last copy of each one).
+    """
+    deferred = _deferred.get()
+    if deferred is None:
+        func([item])
+    else:
+        deferred.setdefault(func, {})[item] = item
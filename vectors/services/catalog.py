@@ -0,0 +1,60 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_MODIFIED_KEY = "catalog:modified"
+TOTAL_VECTORS_KEY = "catalog:total_vectors"
+
+
+def get_version():
+    """
+    Return a token that changes every time the catalog (vectors, tags or featured
+    blocks) changes. Use it in the cache keys of anything derived from the catalog.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # We don't know when it changed for the last time, so assume it's now
+        cache.add(CATALOG_MODIFIED_KEY, timezone.now(), None)
+        cache.add(CATALOG_VERSION_KEY, uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache.set(CATALOG_MODIFIED_KEY, timezone.now(), None)
+    cache.set(CATALOG_VERSION_KEY, uuid4().hex, None)
+
+
+def get_last_modified():
+    """
+    Return when the catalog was modified for the last time: the last `Vector.uploaded`,
+    or the last change of the catalog seen by this cache, if it's later.
+    """
+    from vectors.models import Vector
+
+    version = get_version()
+    last_uploaded = cache.get_or_set(
+        f"catalog:last_uploaded:{version}",
+        lambda: Vector.objects.aggregate(last_uploaded=Max('uploaded'))['last_uploaded'],
+        None
+    )
+    return max(filter(None, [last_uploaded, cache.get(CATALOG_MODIFIED_KEY)]), default=None)
+
+
+def get_total_vectors():
+    """
+    Return the number of vectors. It's counted once per catalog version, and
+    again after COUNT_CACHE_TIMEOUT seconds.
+    """
+    from vectors.models import Vector
+
+    return cache.get_or_set(
+        f"{TOTAL_VECTORS_KEY}:{get_version()}",
+        Vector.objects.count,
+        settings.COUNT_CACHE_TIMEOUT
+    )
@@ -0,0 +1,254 @@
+import tempfile
+from datetime import timedelta
+from os.path import basename
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from vectors.filters import filter_by_tag_names
+from vectors.models import ExportJob, Vector
+from vectors.services import archives as archives_services
+from vectors.services import catalog as catalog_services
+from vectors.services import images as images_services
+
+
+# Params of a download (the query params of the download endpoint)
+PARAMS = ['tags', 'id', 'img_format', 'suggested', 'stroke', 'fill', 'size']
+
+
+def parse_params(params):
+    errors = []
+    ok = True
+    if 'tags' not in params and 'id' not in params:
+        errors.append('tags or id are mandatory')
+        ok = False
+    elif 'tags' in params and 'id' in params:
+        errors.append('tags or id, only one of them')
+        ok = False
+
+    if 'img_format' not in params:
+        errors.append('img_format is mandatory')
+        ok = False
+    else:
+        img_format = params.get('img_format')
+        if img_format not in ['png', 'svg', 'gif', 'both']:
+            errors.append('incorrect img_format: svg or png')
+            ok = False
+        size = params.get('size', None)
+        if size is None and img_format in ["png"]:
+            errors.append('size param is needed for this format')
+            ok = False
+        if size:
+            try:
+                float(size)
+            except ValueError:
+                errors.append('size must be a valid number')
+                ok = False
+
+    return ok, errors
+
+
+def get_vectors(params):
+    """
+    Return the vectors to download with `params`: the ones with all the `tags`,
+    the one with the `id` or, for the exports of the admin, the ones in `ids`.
+    """
+    img_format = params.get('img_format')
+    suggested = params.get('suggested', False)
+
+    queryset = Vector.objects
+
+    # filter by img format
+    if img_format == 'gif':
+        if suggested:
+            queryset = queryset.exclude(colored_gif="").exclude(colored_gif__isnull=True)
+        else:
+            queryset = queryset.exclude(gif="").exclude(gif__isnull=True)
+    elif img_format != 'both':
+        queryset = queryset.exclude(svg="").exclude(svg__isnull=True)
+
+    # filter by tags
+    if 'tags' in params:
+        tags = params['tags'].split(',')
+        queryset = filter_by_tag_names(queryset, tags)
+
+    elif 'ids' in params:
+        queryset = queryset.filter(id__in=params['ids'])
+
+    else: # id in params
+        vector_id = params['id']
+        queryset = queryset.filter(id=vector_id)
+
+    return queryset.distinct()
+
+
+def customization(vector, suggested, new_stroke, new_fill):
+    """
+    Return the svg file, the stroke/fill colors to render for `vector` and the
+    stored template of the svg file (if it has one).
+    """
+    if suggested:
+        if vector.colored_svg:
+            return vector.colored_svg, None, None, None
+        if vector.generated_colored_svg:
+            return vector.generated_colored_svg, None, None, None
+        return vector.svg, vector.stroke_color, vector.fill_color, vector.svg_template
+    return vector.svg, new_stroke, new_fill, vector.svg_template
+
+
+def bulk_files(vectors, img_format, suggested, new_stroke, new_fill, size):
+    """
+    Yield `(name, content)` for every file to include in a bulk download.
+    """
+    # si el formato es svg
+    if img_format == 'svg':
+        for vector in vectors.iterator():
+            svg, stroke, fill, template = customization(vector, suggested, new_stroke, new_fill)
+            yield basename(svg.name), images_services.render_svg(svg, stroke, fill, template)
+
+    # si el formato es png
+    elif img_format == 'png':
+        jobs = (
+            (vector, *customization(vector, suggested, new_stroke, new_fill))
+            for vector in vectors.iterator()
+        )
+        for vector, png in images_services.render_pngs(jobs, size):
+            svg, _, _, _ = customization(vector, suggested, new_stroke, new_fill)
+            yield basename(svg.name).replace('.svg', '.png'), png
+
+    # si el formato es gif
+    elif img_format == 'gif':
+        for vector in vectors.iterator():
+            yield gif_file(vector, suggested)
+
+    # si el formato es both (png+svg+gif)
+    elif img_format == 'both':
+        jobs = (
+            (vector, *customization(vector, suggested, new_stroke, new_fill))
+            for vector in vectors.exclude(svg="").exclude(svg__isnull=True).iterator()
+        )
+        for vector, png in images_services.render_pngs(jobs, size):
+            svg, stroke, fill, template = customization(vector, suggested, new_stroke, new_fill)
+            yield basename(svg.name), images_services.render_svg(svg, stroke, fill, template)
+            yield basename(svg.name).replace('.svg', '.png'), png
+
+        gif_vectors = (vectors
+            .exclude(gif="", colored_gif="")
+            .exclude(gif__isnull=True, colored_gif__isnull=True))
+        for vector in gif_vectors.iterator():
+            if vector.gif or vector.colored_gif:
+                yield gif_file(vector, suggested)
+
+
+def both_files(vector, suggested, new_stroke, new_fill, size):
+    """
+    Yield `(name, content)` for the svg, the png and the gif of `vector`.
+    """
+    if vector.svg:
+        svg, stroke, fill, template = customization(vector, suggested, new_stroke, new_fill)
+        yield basename(svg.name), images_services.render_svg(svg, stroke, fill, template)
+        yield basename(svg.name).replace('.svg', '.png'), images_services.render_png(svg, size, stroke, fill, template)
+
+    if vector.gif or vector.colored_gif:
+        yield gif_file(vector, suggested)
+
+
+def gif_file(vector, suggested):
+    if suggested:
+        gif = vector.colored_gif if vector.colored_gif else vector.gif
+    else:
+        gif = vector.gif if vector.gif else vector.colored_gif
+
+    with open(gif.path, 'rb') as f:
+        return basename(gif.name), f.read()
+
+
+##################################################################
+# EXPORT JOBS
+##################################################################
+
+def submit(params, name):
+    """
+    Queue the export of the zip `name` with the files of a bulk download with
+    `params`. The export is done by the `run_export_worker` command.
+
+    While the catalog doesn't change, the same export is returned for the same
+    `params` (if it's pending, running or done and not expired yet).
+    """
+    version = catalog_services.get_version()
+    expired = timezone.now() - timedelta(seconds=settings.EXPORT_EXPIRATION)
+    job = (ExportJob.objects
+        .filter(params=params, name=name, catalog_version=version)
+        .filter(
+            Q(status__in=[ExportJob.Status.PENDING, ExportJob.Status.RUNNING]) |
+            Q(status=ExportJob.Status.DONE, finished__gte=expired)
+        )
+        .order_by('-created')
+        .first())
+    if job is None:
+        job = ExportJob.objects.create(params=params, name=name, catalog_version=version)
+    return job
+
+
+def claim_job():
+    """
+    Take the oldest pending export (or a running one whose worker has died) and
+    mark it as running. Workers skip the exports locked by other workers, so
+    each one is only taken once.
+    """
+    stalled = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    with transaction.atomic():
+        job = (ExportJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ExportJob.Status.PENDING) |
+                Q(status=ExportJob.Status.RUNNING, started__lt=stalled)
+            )
+            .order_by('created')
+            .first())
+        if job is not None:
+            job.status = ExportJob.Status.RUNNING
+            job.started = timezone.now()
+            job.save(update_fields=['status', 'started'])
+    return job
+
+
+def run_job(job):
+    params = job.params
+    try:
+        files = bulk_files(
+            get_vectors(params),
+            params['img_format'],
+            params.get('suggested', False),
+            params.get('stroke'),
+            params.get('fill'),
+            float(params.get('size') or '0'),
+        )
+        with tempfile.TemporaryFile() as f:
+            for chunk in archives_services.stream_zip(files):
+                f.write(chunk)
+            f.seek(0)
+            job.file.save(job.name, File(f), save=False)
+    except Exception as e:
+        job.status = ExportJob.Status.FAILED
+        job.error = f'{type(e).__name__}: {e}'
+    else:
+        job.status = ExportJob.Status.DONE
+
+    job.finished = timezone.now()
+    job.save(update_fields=['file', 'status', 'error', 'finished'])
+
+
+def delete_expired_jobs():
+    """
+    Delete the exports finished more than EXPORT_EXPIRATION seconds ago, with
+    their zips. Return how many were deleted.
+    """
+    expired = timezone.now() - timedelta(seconds=settings.EXPORT_EXPIRATION)
+    deleted, _ = (ExportJob.objects
+        .filter(status__in=[ExportJob.Status.DONE, ExportJob.Status.FAILED], finished__lt=expired)
+        .delete())
+    return deleted
@@ -0,0 +1,44 @@
+import hashlib
+import json
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.encoders import JSONEncoder
+
+from vectors.models import Featured
+from vectors.serializers import FeaturedSerializer
+from vectors.services import catalog as catalog_services
+
+
+def build_payload(request):
+    featured = Featured.objects.all().order_by('order')
+    serializer = FeaturedSerializer(featured, many=True, context={'request': request})
+    # Keep only plain data in the cache (serialized urls are `Hyperlink` objects)
+    return json.loads(json.dumps(serializer.data, cls=JSONEncoder))
+
+
+def _payload_key(request, variant):
+    # Serialized urls are absolute, so the payload depends on the host
+    base_url = hashlib.md5(request.build_absolute_uri('/').encode('utf-8')).hexdigest()
+    return f"featured:payload:{catalog_services.get_version()}:{base_url}:{variant}"
+
+
+def get_payload(request):
+    """
+    Return the featured blocks, serialized. There are FEATURED_ROTATION_VARIANTS
+    payloads (each one with its own random vectors) cached at the same time, and
+    each request gets one of them at random. They are rebuilt when they expire,
+    after FEATURED_CACHE_TIMEOUT seconds, or when the catalog changes.
+    """
+    variant = random.randrange(settings.FEATURED_ROTATION_VARIANTS)
+    return cache.get_or_set(
+        _payload_key(request, variant),
+        lambda: build_payload(request),
+        settings.FEATURED_CACHE_TIMEOUT
+    )
+
+
+def refresh_payloads(request):
+    for variant in range(settings.FEATURED_ROTATION_VARIANTS):
+        cache.set(_payload_key(request, variant), build_payload(request), settings.FEATURED_CACHE_TIMEOUT)
@@ -1,38 +1,128 @@
-from xml.dom import minidom
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 import cairosvg
 import svgutils.transform as sg
 
+from django.conf import settings
 
-def customize_vector(svg, directory, new_stroke=None, new_fill=None):
-    # NOTE: Por consenso los svgs usarán fill blanco y negro
-    #  - stroke => fil negro => None, "", #000, #000000, #030303 (old, deprecated)
-    #  - fill => fil blanco: #fff, #ffffff
-    with (
-        minidom.parse(svg.path) as dom,
-        open(f'{directory}/{svg.name}', 'w') as newsvg
-    ):
-        if new_stroke or new_fill:
-            paths = dom.getElementsByTagName('path')
-            for path in paths:
-                fill = path.getAttribute('fill')
-                if fill in ['#030303', '#000000', '#000', "", None]:
-                    fill = f'#{new_stroke}'.replace('#none', 'none').replace("##", "#")
-                else: # fill == fff | ffffff
-                    fill = f'#{new_fill}'.replace('#none', 'none').replace("##", "#")
-                path.setAttribute('fill', fill)
-        newsvg.write(dom.toxml())
-
-
-def export_to_png(svg, size):
-    orig = str(svg)
-    fig = sg.fromfile(orig)
+from vectors.services import render_cache
+from vectors.services import svg_templates
+
+
+def customized_svg(path, new_stroke=None, new_fill=None, template=None):
+    # `template` is the stored template of the svg (`Vector.svg_template`), if there is one
+    if template:
+        template = svg_templates.SvgTemplate.from_dict(template)
+    else:
+        template = svg_templates.get_template(path)
+    if not (new_stroke or new_fill):
+        return template.xml
+
+    return template.render(
+        f'#{new_stroke}'.replace('#none', 'none').replace("##", "#"),
+        f'#{new_fill}'.replace('#none', 'none').replace("##", "#"),
+    )
+
+
+def svg_to_png(svg_content, size):
+    fig = sg.fromstring(svg_content.decode('utf-8'))
     width = float(fig.width[:-2])
     height = float(fig.height[:-2])
     max_size = max(width, height)
     increase_ratio = float(size / max_size)
     new_width = round(width * increase_ratio)
     new_height = round(height * increase_ratio)
-    new_name = svg.name.replace('.svg', '.png')
-    dest = str(svg.parent / new_name)
-    cairosvg.svg2png(url=orig, write_to=dest, output_width=new_width, output_height=new_height)
+    return cairosvg.svg2png(bytestring=svg_content, output_width=new_width, output_height=new_height)
+
+
+def _svg_content(path, new_stroke=None, new_fill=None, template=None):
+    if not (new_stroke or new_fill):
+        with open(path, 'rb') as f:
+            return f.read()
+    return customized_svg(path, new_stroke, new_fill, template).encode('utf-8')
+
+
+def _png_content(path, size, new_stroke=None, new_fill=None, template=None):
+    # NOTE: it runs inside the render pool processes, don't use django models here
+    return svg_to_png(_svg_content(path, new_stroke, new_fill, template), size)
+
+
+def render_svg(svg, new_stroke=None, new_fill=None, template=None):
+    """
+    Return the content (bytes) of `svg` with the stroke/fill customization applied.
+    Renders are stored in the render cache, keyed by the source file and the params.
+    """
+    if not (new_stroke or new_fill):
+        return _svg_content(svg.path)
+
+    return render_cache.get_or_render(
+        svg.path,
+        lambda: _svg_content(svg.path, new_stroke, new_fill, template),
+        format='svg', stroke=new_stroke, fill=new_fill,
+    )
+
+
+def render_png(svg, size, new_stroke=None, new_fill=None, template=None):
+    """
+    Return the content (bytes) of `svg`, customized and rasterized to PNG at `size` px.
+    Renders are stored in the render cache, keyed by the source file and the params.
+    """
+    return render_cache.get_or_render(
+        svg.path,
+        lambda: _png_content(svg.path, size, new_stroke, new_fill, template),
+        format='png', stroke=new_stroke, fill=new_fill, size=size,
+    )
+
+
+##################################################################
+# RENDER POOL
+##################################################################
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def _get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        # The exports run in several threads, only one of them creates the pool
+        with _render_pool_lock:
+            if _render_pool is None:
+                _render_pool = ProcessPoolExecutor(
+                    max_workers=settings.RENDER_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _render_pool
+
+
+def render_pngs(jobs, size):
+    """
+    Like `render_png`, but for many svgs. Cache misses are rasterized in the render
+    pool, across all the cores, with at most RENDER_POOL_MAX_CONCURRENCY of them in
+    flight per call so one big export can't take the whole pool.
+
+    :param jobs: iterable of `(item, svg, new_stroke, new_fill, template)`.
+    :return: generator of `(item, png content)`, in the same order as `jobs`.
+    """
+    pending = deque()
+
+    def resolve(item, key, result):
+        if isinstance(result, Future):
+            result = result.result()
+            render_cache.set(key, result)
+        return item, result
+
+    for item, svg, new_stroke, new_fill, template in jobs:
+        key = render_cache.cache_key(svg.path, format='png', stroke=new_stroke, fill=new_fill, size=size)
+        result = render_cache.get(key)
+        if result is None:
+            result = _get_render_pool().submit(_png_content, svg.path, size, new_stroke, new_fill, template)
+        pending.append((item, key, result))
+
+        if len(pending) >= settings.RENDER_POOL_MAX_CONCURRENCY:
+            yield resolve(*pending.popleft())
 
+    while pending:
+        yield resolve(*pending.popleft())
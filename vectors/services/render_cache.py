@@ -0,0 +1,124 @@
+import hashlib
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# Eviction leaves the cache at this fraction of its max size, so it doesn't run
+# again on the next write
+EVICTION_TARGET = 0.9
+
+# cache dir => size of its files, as seen by this process. It's set by a scan of
+# the dir (the first time and after every eviction) and increased on every write,
+# so only the writes over the max size walk the cache. The writes of other
+# processes are only seen by the next scan.
+_sizes = {}
+_sizes_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def _file_hash(path, mtime_ns, size):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def source_hash(path):
+    # Keyed by the mtime and size, so we only hash a source file once
+    stat = os.stat(path)
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+def cache_key(path, **params):
+    raw = "|".join([source_hash(path)] + [f"{k}={params[k]}" for k in sorted(params)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(settings.RENDER_CACHE_DIR, key[:2], key)
+
+
+def get(key):
+    path = _cache_path(key)
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+
+    # Touch the entry, eviction drops the least recently used ones first
+    os.utime(path)
+    return content
+
+
+def set(key, content):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temp file and move it, so readers never see a partial render
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+    cache_dir = settings.RENDER_CACHE_DIR
+    with _sizes_lock:
+        if cache_dir not in _sizes:
+            _sizes[cache_dir] = _scan(cache_dir)[1]
+        else:
+            _sizes[cache_dir] += len(content)
+        over_max_size = _sizes[cache_dir] > settings.RENDER_CACHE_MAX_SIZE
+
+    if over_max_size:
+        evict()
+
+
+def _scan(cache_dir):
+    """
+    Return the `(mtime, size, path)` of the files in `cache_dir` and their total size.
+    """
+    entries = []
+    total_size = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+            total_size += stat.st_size
+    return entries, total_size
+
+
+def evict(max_size=None):
+    """
+    Remove the least recently used renders until the cache is under `max_size`
+    (`EVICTION_TARGET` of it, if it was over).
+    """
+    cache_dir = settings.RENDER_CACHE_DIR
+    max_size = settings.RENDER_CACHE_MAX_SIZE if max_size is None else max_size
+
+    entries, total_size = _scan(cache_dir)
+    if total_size > max_size:
+        target_size = max_size * EVICTION_TARGET
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= target_size:
+                break
+
+    with _sizes_lock:
+        _sizes[cache_dir] = total_size
+
+
+def get_or_render(path, render, **params):
+    key = cache_key(path, **params)
+    content = get(key)
+    if content is None:
+        content = render()
+        set(key, content)
+    return content
@@ -0,0 +1,121 @@
+import hashlib
+import re
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+
+from django.conf import settings
+from django.core.cache import cache
+
+from vectors.filters import filter_by_tag_names
+from vectors.models import Vector
+
+
+SVG_NAMESPACE = 'http://www.w3.org/2000/svg'
+
+
+def symbol_id(vector):
+    return f'vector-{vector.id}'
+
+
+def _view_box(svg):
+    view_box = svg.getAttribute('viewBox')
+    if view_box:
+        return view_box
+
+    # Fallback to the size of the svg (i.e. "24px" => 24)
+    width = re.match(r'[\d.]+', svg.getAttribute('width'))
+    height = re.match(r'[\d.]+', svg.getAttribute('height'))
+    if width and height:
+        return f'0 0 {width.group()} {height.group()}'
+    return None
+
+
+def build_sprite(vectors, suggested=False):
+    """
+    Combine the svgs of `vectors` in one svg, with a `<symbol id="vector-<id>">` for
+    each of them, so they can be used with `<use href="sprite.svg#vector-<id>"/>`.
+    """
+    sprite = minidom.Document()
+    root = sprite.createElementNS(SVG_NAMESPACE, 'svg')
+    root.setAttribute('xmlns', SVG_NAMESPACE)
+    sprite.appendChild(root)
+
+    for vector in vectors:
+        content = (suggested and vector.colored_svg_content) or vector.svg_content
+        if not content:
+            continue
+
+        try:
+            svg = minidom.parseString(content).documentElement
+        except ExpatError:
+            continue
+
+        symbol = sprite.createElement('symbol')
+        symbol.setAttribute('id', symbol_id(vector))
+        view_box = _view_box(svg)
+        if view_box:
+            symbol.setAttribute('viewBox', view_box)
+        for child in svg.childNodes:
+            symbol.appendChild(sprite.importNode(child, True))
+        root.appendChild(symbol)
+
+    return sprite.toxml()
+
+
+def tag_vectors(tags):
+    return (
+        filter_by_tag_names(Vector.objects.defer('svg_template').exclude(svg="").exclude(svg__isnull=True), tags)
+        .distinct()
+        .order_by('-uploaded', '-id')
+    )
+
+
+# Fields of a vector that change its symbol in the sprites
+SYMBOL_FIELDS = ['id', 'svg', 'colored_svg', 'generated_colored_svg', 'stroke_color', 'fill_color', 'content_hash']
+
+
+def _tag_members(tags):
+    return list(tag_vectors(tags).values_list(*SYMBOL_FIELDS))
+
+
+def _sprite_key(members, suggested):
+    # Keyed by the vectors of the tags (and their files), so a sprite is only
+    # rebuilt when one of its own vectors changes
+    members_hash = hashlib.md5(repr(members).encode('utf-8')).hexdigest()
+    return f"sprites:{members_hash}:{int(suggested)}"
+
+
+def _build_tag_sprite(members, suggested):
+    if not members:
+        return None
+    # In the order of the members
+    positions = {member[0]: i for i, member in enumerate(members)}
+    vectors = sorted(
+        Vector.objects.defer('svg_template').filter(id__in=positions),
+        key=lambda vector: positions[vector.id]
+    )
+    return build_sprite(vectors, suggested)
+
+
+def get_sprite(tags, suggested=False):
+    """
+    Return the sprite with the vectors that have all the `tags` (`None` if there
+    aren't any). Sprites are cached by their vectors, so they are rebuilt when a
+    vector of the tags is added, removed or changed.
+    """
+    members = _tag_members(tags)
+    key = _sprite_key(members, suggested)
+    sprite = cache.get(key)
+    if sprite is None:
+        sprite = _build_tag_sprite(members, suggested)
+        if sprite is not None:
+            cache.set(key, sprite, settings.SPRITE_CACHE_TIMEOUT)
+    return sprite
+
+
+def refresh_sprite(tags, suggested=False):
+    members = _tag_members(tags)
+    sprite = _build_tag_sprite(members, suggested)
+    if sprite is not None:
+        cache.set(_sprite_key(members, suggested), sprite, settings.SPRITE_CACHE_TIMEOUT)
+    return sprite
@@ -0,0 +1,85 @@
+import os
+import re
+import uuid
+from functools import lru_cache
+from xml.dom import minidom
+
+
+# NOTE: Por consenso los svgs usarán fill blanco y negro
+#  - stroke => fil negro => None, "", #000, #000000, #030303 (old, deprecated)
+#  - fill => fil blanco: #fff, #ffffff
+STROKE_FILLS = ['#030303', '#000000', '#000', "", None]
+
+STROKE = 's'
+FILL = 'f'
+
+
+@lru_cache(maxsize=256)
+def _escape_attribute(value):
+    # Escape the value exactly like minidom does when it writes an attribute
+    element = minidom.Document().createElement('a')
+    element.setAttribute('v', value)
+    return element.toxml()[len('<a v="'):-len('"/>')]
+
+
+class SvgTemplate:
+    """
+    An svg parsed once and split around the `fill` of its paths, so recoloring it
+    is a string substitution instead of a parse, a walk over the paths and a
+    serialization. The output is the same as the one of minidom.
+
+    :param xml: the svg as serialized by minidom, without changes.
+    :param parts: the svg, split by the fills of the paths.
+    :param slots: the kind of each fill, `STROKE` (black) or `FILL` (white).
+    """
+    def __init__(self, xml, parts, slots):
+        self.xml = xml
+        self.parts = parts
+        self.slots = slots
+
+    @classmethod
+    def parse(cls, path):
+        with minidom.parse(path) as dom:
+            xml = dom.toxml()
+
+            # Mark each fill with a token that can't be in the svg, and split by them
+            token = f'coco-{uuid.uuid4().hex}-'
+            for element in dom.getElementsByTagName('path'):
+                slot = STROKE if element.getAttribute('fill') in STROKE_FILLS else FILL
+                element.setAttribute('fill', f'{token}{slot}')
+            pieces = re.split(f'{token}([{STROKE}{FILL}])', dom.toxml())
+
+        return cls(xml, pieces[0::2], pieces[1::2])
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['xml'], data['parts'], data['slots'])
+
+    def to_dict(self):
+        return {'xml': self.xml, 'parts': self.parts, 'slots': "".join(self.slots)}
+
+    def render(self, stroke, fill):
+        """
+        Return the svg with `stroke` as the fill of the black paths and `fill` as
+        the fill of the white ones (the values are used as they are).
+        """
+        values = {STROKE: _escape_attribute(stroke), FILL: _escape_attribute(fill)}
+        content = [self.parts[0]]
+        for slot, part in zip(self.slots, self.parts[1:]):
+            content.append(values[slot])
+            content.append(part)
+        return "".join(content)
+
+
+@lru_cache(maxsize=1024)
+def _load_template(path, mtime_ns, size):
+    return SvgTemplate.parse(path)
+
+
+def get_template(path):
+    """
+    Return the `SvgTemplate` of the svg file in `path`. Templates are kept in memory
+    until the file changes.
+    """
+    stat = os.stat(path)
+    return _load_template(path, stat.st_mtime_ns, stat.st_size)
@@ -1,3 +1,930 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.throttling import ScopedRateThrottle
+
+from vectors.models import ExportJob, Vector, Featured, update_search_text
+from vectors.services import archives as archives_services
+from vectors.services import batching
+from vectors.services import catalog as catalog_services
+from vectors.services import images as images_services
+from vectors.services import render_cache
+from vectors.services import sprites as sprites_services
+
+
+def setUpModule():
+    # The default cache is stored in files, shared with the other processes, keep
+    # the one of the tests apart (and empty on every run)
+    cache_dir = tempfile.mkdtemp()
+    unittest.addModuleCleanup(shutil.rmtree, cache_dir)
+    cache_settings = override_settings(CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": cache_dir,
+        },
+        "contents": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "test-vector-contents",
+        },
+    })
+    cache_settings.enable()
+    unittest.addModuleCleanup(cache_settings.disable)
+
+
+class TempMediaMixin:
+    """
+    Keep the media files (and the render cache) of each test in its own temp directory.
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=self.media_root,
+            RENDER_CACHE_DIR=os.path.join(self.media_root, "renders"),
+        ))
+
+
+class VectorQueriesTest(TestCase):
+    def create_vectors(self, count):
+        for _ in range(count):
+            vector = Vector.objects.create(name="vector", svg="vector.svg")
+            vector.tags.add("animal", f"animal-{vector.id}")
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assertConstantQueries(self, url):
+        self.create_vectors(2)
+        queries = self.count_queries(url)
+
+        self.create_vectors(10)
+        self.assertEqual(self.count_queries(url), queries)
+
+    def test_list_queries_dont_grow_with_the_page(self):
+        self.assertConstantQueries("/api/vectors/")
+
+    def test_latest_queries_dont_grow_with_the_vectors(self):
+        self.assertConstantQueries("/api/vectors/latest/")
+
+    def test_featured_queries_dont_grow_with_the_vectors(self):
+        Featured.objects.create(name="Animals", tag="animal")
+        self.assertConstantQueries("/api/vectors/featured/")
+
+
+class FeaturedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Featured.objects.create(name="Animals", tag="animal")
+
+    def test_featured_is_served_from_the_cache(self):
+        with self.settings(FEATURED_ROTATION_VARIANTS=1):
+            self.client.get("/api/vectors/featured/")
+            with self.assertNumQueries(0):
+                self.client.get("/api/vectors/featured/")
+
+    def test_featured_is_rebuilt_when_the_catalog_changes(self):
+        with self.settings(FEATURED_ROTATION_VARIANTS=1):
+            response = self.client.get("/api/vectors/featured/")
+            self.assertEqual(response.json()[0]["vectors"], [])
+
+            vector = Vector.objects.create(name="cat", svg="cat.svg")
+            vector.tags.add("animal")
+
+            response = self.client.get("/api/vectors/featured/")
+            self.assertEqual([v["id"] for v in response.json()[0]["vectors"]], [vector.id])
+
+    def test_featured_is_rebuilt_when_reordered_in_the_admin(self):
+        Featured.objects.update(order=1)
+        animals = Featured.objects.get(name="Animals")
+        plants = Featured.objects.create(name="Plants", tag="plant", order=2)
+        with self.settings(FEATURED_ROTATION_VARIANTS=1):
+            response = self.client.get("/api/vectors/featured/")
+            self.assertEqual([f["name"] for f in response.json()], ["Animals", "Plants"])
+
+            self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+            response = self.client.post(
+                reverse("admin:vectors_featured_sortable_update"),
+                json.dumps({"updatedItems": [[plants.id, animals.order], [animals.id, plants.order]]}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get("/api/vectors/featured/")
+            self.assertEqual([f["name"] for f in response.json()], ["Plants", "Animals"])
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        for tag in ["elephant", "elephant", "elephants", "elephant", "elephant hat", "elephant"]:
+            vector = Vector.objects.create(name="vector", svg="vector.svg")
+            vector.tags.add(tag)
+        # All of them uploaded at the same time, so they are only ordered by the id
+        Vector.objects.update(uploaded=Vector.objects.first().uploaded)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [vector["id"] for vector in response.json()["results"]]
+            url = response.json()["next"]
+        return ids
+
+    def page_number_ids(self, query):
+        return [vector["id"] for vector in self.client.get(f"/api/vectors/?{query}&page_size=100").json()["results"]]
+
+    def test_cursor_pages_cover_all_the_vectors_without_counting(self):
+        url = "/api/vectors/?pagination=cursor&page_size=2"
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertFalse(any("COUNT(" in query["sql"] for query in context.captured_queries))
+
+            ids += [vector["id"] for vector in response.json()["results"]]
+            url = response.json()["next"]
+
+        self.assertEqual(ids, list(Vector.objects.order_by("-uploaded", "-id").values_list("id", flat=True)))
+
+    def test_cursor_pages_follow_the_order_of_the_filters(self):
+        for query in ["similarity=elephant", "ordering=-uploaded", "ordering=uploaded", "tags=elephant&ordering=-uploaded"]:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.walk(f"/api/vectors/?{query}&pagination=cursor&page_size=2"),
+                    self.page_number_ids(query),
+                )
+
+    def test_cursor_is_the_position_of_the_last_item(self):
+        response = self.client.get("/api/vectors/?similarity=elephant&pagination=cursor&page_size=2").json()
+        cursor = parse_qs(urlparse(response["next"]).query)["cursor"][0]
+        last = Vector.objects.get(id=response["results"][-1]["id"])
+
+        similarity, uploaded, id = json.loads(base64.b64decode(cursor))["p"]
+        self.assertEqual((uploaded, id), (last.uploaded.isoformat(), last.id))
+        self.assertEqual(similarity, 1.0)
+
+    def test_previous_pages_walk_back_to_the_first_one(self):
+        url = "/api/vectors/?similarity=elephant&pagination=cursor&page_size=2"
+        last_page = None
+        while url:
+            last_page = url
+            url = self.client.get(url).json()["next"]
+        last_page_ids = [vector["id"] for vector in self.client.get(last_page).json()["results"]]
+        previous = self.client.get(last_page).json()["previous"]
+
+        ids = self.page_number_ids("similarity=elephant")
+        pages = []
+        url = previous
+        while url:
+            response = self.client.get(url).json()
+            pages.insert(0, [vector["id"] for vector in response["results"]])
+            url = response["previous"]
+        self.assertEqual(sum(pages, []) + last_page_ids, ids)
+
+    def test_invalid_cursor(self):
+        for cursor in ["bz0y", "x", base64.b64encode(b'{"p": ["a", "b"], "r": 0}').decode()]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f"/api/vectors/?pagination=cursor&cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+
+class NeighborsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for tag in ["cat", "dog", "dogs", "cat", "dog hat"]:
+            vector = Vector.objects.create(name=tag, svg="vector.svg")
+            vector.tags.add(tag, "animal")
+        # Some of them uploaded at the same time, ordered by the id
+        Vector.objects.filter(name__startswith="dog").update(uploaded=Vector.objects.first().uploaded)
+
+    def assertNeighborsFollowTheList(self, query):
+        ids = [vector["id"] for vector in self.client.get(f"/api/vectors/?{query}&page_size=100").json()["results"]]
+        self.assertGreater(len(ids), 1)
+
+        for i, id in enumerate(ids):
+            neighbors = self.client.get(f"/api/vectors/{id}/?{query}").json()["neighbors"]
+            previous = neighbors["previous"] and neighbors["previous"]["id"]
+            next = neighbors["next"] and neighbors["next"]["id"]
+            self.assertEqual(previous, ids[i - 1] if i > 0 else None)
+            self.assertEqual(next, ids[i + 1] if i + 1 < len(ids) else None)
+
+    def test_neighbors_in_the_default_order(self):
+        self.assertNeighborsFollowTheList("")
+
+    def test_neighbors_in_the_order_of_the_param(self):
+        self.assertNeighborsFollowTheList("ordering=-uploaded")
+
+    def test_neighbors_with_the_same_tags(self):
+        self.assertNeighborsFollowTheList("tags=dog")
+
+    def test_neighbors_by_similarity(self):
+        self.assertNeighborsFollowTheList("similarity=dog")
+
+    def test_first_and_last_vectors_have_one_neighbor(self):
+        first, *_, last = Vector.objects.order_by("id")
+
+        neighbors = self.client.get(f"/api/vectors/{first.id}/").json()["neighbors"]
+        self.assertIsNone(neighbors["previous"])
+        self.assertEqual(neighbors["next"]["name"], "dog")
+
+        neighbors = self.client.get(f"/api/vectors/{last.id}/").json()["neighbors"]
+        self.assertEqual(neighbors["previous"]["name"], "cat")
+        self.assertIsNone(neighbors["next"])
+
+
+class StableOrderingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ids = [Vector.objects.create(name="vector", svg="vector.svg").id for _ in range(4)]
+        Vector.objects.update(uploaded=Vector.objects.first().uploaded)
+
+    def get_ids(self, url):
+        response = self.client.get(url).json()
+        # `latest` isn't paginated
+        vectors = response["results"] if isinstance(response, dict) else response
+        return [vector["id"] for vector in vectors]
+
+    def test_ties_are_ordered_by_the_id(self):
+        self.assertEqual(self.get_ids("/api/vectors/?ordering=uploaded"), self.ids)
+        self.assertEqual(self.get_ids("/api/vectors/?ordering=-uploaded"), self.ids[::-1])
+        self.assertEqual(self.get_ids("/api/vectors/latest/"), self.ids[::-1])
+
+    def test_pages_of_ties_dont_repeat_vectors(self):
+        ids = []
+        for page in (1, 2):
+            ids += self.get_ids(f"/api/vectors/?ordering=-uploaded&page_size=2&page={page}")
+        self.assertEqual(ids, self.ids[::-1])
+
+
+class CountCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for _ in range(3):
+            Vector.objects.create(name="vector", svg="vector.svg")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        return response, [query["sql"] for query in context.captured_queries if "COUNT(" in query["sql"]]
+
+    def test_total_is_counted_once_per_catalog_version(self):
+        self.count_queries("/api/vectors/total/")
+        response, count_queries = self.count_queries("/api/vectors/total/")
+        self.assertEqual(response.json()["totalVectors"], 3)
+        self.assertEqual(count_queries, [])
+
+        Vector.objects.create(name="vector", svg="vector.svg")
+        Vector.objects.first().delete()
+        Vector.objects.create(name="vector", svg="vector.svg")
+
+        response, count_queries = self.count_queries("/api/vectors/total/")
+        self.assertEqual(response.json()["totalVectors"], 4)
+        self.assertEqual(len(count_queries), 1)
+
+    def test_list_count_is_cached_until_the_catalog_changes(self):
+        self.count_queries("/api/vectors/")
+        response, count_queries = self.count_queries("/api/vectors/")
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(count_queries, [])
+
+        Vector.objects.create(name="vector", svg="vector.svg")
+        response, count_queries = self.count_queries("/api/vectors/")
+        self.assertEqual(response.json()["count"], 4)
+
+
+class ConditionalRequestsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Vector.objects.create(name="vector", svg="vector.svg")
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get("/api/vectors/")
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get("/api/vectors/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_responses_are_always_revalidated(self):
+        response = self.client.get("/api/vectors/")
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_list_is_modified_when_the_catalog_changes(self):
+        etag = self.client.get("/api/vectors/")["ETag"]
+
+        Vector.objects.create(name="vector", svg="vector.svg")
+
+        response = self.client.get("/api/vectors/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_not_conditional_with_a_per_process_cache(self):
+        etag = self.client.get("/api/vectors/")["ETag"]
+
+        with self.settings(CACHES={**settings.CACHES, "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            response = self.client.get("/api/vectors/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class LiteListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        vector = Vector.objects.create(name="vector", svg="vector.svg")
+        vector.tags.add("animal")
+
+    def test_lite_list_has_no_svg_content(self):
+        vector = self.client.get("/api/vectors/?lite=true").json()["results"][0]
+        self.assertEqual(vector["tags"], "animal")
+        self.assertNotIn("svgContent", vector)
+        self.assertNotIn("coloredSvgContent", vector)
+
+    def test_list_with_only_some_fields(self):
+        vector = self.client.get("/api/vectors/?fields=id,svgContent").json()["results"][0]
+        self.assertEqual(set(vector), {"id", "svgContent"})
+
+
+class VectorContentsTest(TestCase):
+    def test_contents_of_many_vectors_in_one_query(self):
+        vectors = [Vector.objects.create(name="vector", svg="vector.svg") for _ in range(3)]
+        ids = ",".join(str(vector.id) for vector in vectors)
+
+        cache.clear()
+        # The catalog last modified date and the vectors
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/vectors/contents/?ids={ids}")
+        self.assertEqual(
+            [vector["id"] for vector in response.json()],
+            [vector.id for vector in vectors]
+        )
+
+    def test_contents_need_valid_ids(self):
+        self.assertEqual(self.client.get("/api/vectors/contents/").status_code, 400)
+        self.assertEqual(self.client.get("/api/vectors/contents/?ids=1,a").status_code, 400)
+
+
+class SpriteTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="24px" height="24px"><path d="M0 0h24v24z"/></svg>'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def create_vector(self, *tags):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"))
+        vector.tags.add(*tags)
+        return vector
+
+    def test_sprite_has_a_symbol_for_each_vector_of_the_tag(self):
+        cat = self.create_vector("animal", "cat")
+        dog = self.create_vector("animal")
+        self.create_vector("plant")
+
+        response = self.client.get("/api/sprite/?tags=animal")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        sprite = response.content.decode()
+        self.assertIn(f'<symbol id="vector-{cat.id}" viewBox="0 0 24 24">', sprite)
+        self.assertIn(f'<symbol id="vector-{dog.id}" viewBox="0 0 24 24">', sprite)
+        self.assertEqual(sprite.count("<symbol"), 2)
+
+    def test_sprite_is_rebuilt_when_the_tag_changes(self):
+        self.create_vector("animal")
+        self.client.get("/api/sprite/?tags=animal")
+
+        self.create_vector("animal")
+        sprite = self.client.get("/api/sprite/?tags=animal").content.decode()
+        self.assertEqual(sprite.count("<symbol"), 2)
+
+    def test_sprite_is_kept_when_other_vectors_change(self):
+        self.create_vector("animal")
+        call_command("build_sprites", stdout=io.StringIO())
+
+        self.create_vector("plant")
+        with mock.patch.object(sprites_services, "build_sprite") as build_sprite:
+            self.assertEqual(self.client.get("/api/sprite/?tags=animal").status_code, 200)
+        build_sprite.assert_not_called()
+
+    def test_sprite_is_rebuilt_when_the_colors_of_a_vector_change(self):
+        vector = self.create_vector("animal")
+        self.client.get("/api/sprite/?tags=animal&suggested=true")
+
+        vector.stroke_color = "#f00"
+        vector.save()
+        sprite = self.client.get("/api/sprite/?tags=animal&suggested=true").content.decode()
+        self.assertIn('fill="#f00"', sprite)
+
+    def test_sprite_needs_a_tag(self):
+        self.assertEqual(self.client.get("/api/sprite/").status_code, 400)
+        self.assertEqual(self.client.get("/api/sprite/?tags=all").status_code, 400)
+        self.assertEqual(self.client.get("/api/sprite/?tags=unknown").status_code, 400)
+
+
+class CustomizedSvgTest(TestCase):
+    def test_black_paths_get_the_stroke_and_white_paths_the_fill(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".svg") as svg:
+            svg.write(
+                '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/><path d="M1"/>'
+                '<path d="M2" fill="#ffffff"/></svg>'
+            )
+            svg.flush()
+
+            self.assertEqual(
+                images_services.customized_svg(svg.name, "f00", "#0f0"),
+                '<?xml version="1.0" ?><svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#f00"/>'
+                '<path d="M1" fill="#f00"/><path d="M2" fill="#0f0"/></svg>'
+            )
+            self.assertEqual(
+                images_services.customized_svg(svg.name),
+                '<?xml version="1.0" ?><svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/>'
+                '<path d="M1"/><path d="M2" fill="#ffffff"/></svg>'
+            )
+
+
+class RenderCacheTest(TempMediaMixin, TestCase):
+    def test_renders_are_served_from_the_cache(self):
+        source = os.path.join(self.media_root, "vector.svg")
+        with open(source, "w") as f:
+            f.write("<svg/>")
+        renders = []
+
+        def render():
+            renders.append(1)
+            return b"render"
+
+        self.assertEqual(render_cache.get_or_render(source, render, format="png", size=64), b"render")
+        self.assertEqual(render_cache.get_or_render(source, render, format="png", size=64), b"render")
+        self.assertEqual(len(renders), 1)
+
+        render_cache.get_or_render(source, render, format="png", size=128)
+        self.assertEqual(len(renders), 2)
+
+    @override_settings(RENDER_CACHE_MAX_SIZE=35)
+    def test_least_recently_used_renders_are_evicted(self):
+        with mock.patch.object(render_cache, "_scan", wraps=render_cache._scan) as scan:
+            for i, key in enumerate(["a1", "b1", "c1"]):
+                render_cache.set(key, b"0123456789")
+                os.utime(render_cache._cache_path(key), (i, i))
+            # Only the first write walks the cache, while it's under the max size
+            self.assertEqual(scan.call_count, 1)
+
+            render_cache.get("a1")
+            render_cache.set("d1", b"0123456789")
+            self.assertEqual(scan.call_count, 2)
+
+        self.assertIsNone(render_cache.get("b1"))
+        for key in ["a1", "c1", "d1"]:
+            self.assertEqual(render_cache.get(key), b"0123456789")
+
+
+class RenderPoolTest(TempMediaMixin, TestCase):
+    @override_settings(RENDER_POOL_MAX_CONCURRENCY=2)
+    def test_renders_come_in_the_order_of_the_jobs(self):
+        svgs = []
+        for i in range(5):
+            svgs.append(SimpleNamespace(path=os.path.join(self.media_root, f"{i}.svg")))
+            with open(svgs[-1].path, "w") as f:
+                f.write(f"<svg id='{i}'/>")
+        # One of them is already in the render cache
+        render_cache.set(render_cache.cache_key(svgs[2].path, format="png", stroke=None, fill=None, size=64), b"2.svg")
+
+        def png_content(path, size, new_stroke, new_fill, template):
+            # The first jobs are the slowest ones
+            time.sleep(0.01 * (5 - int(os.path.basename(path)[0])))
+            return os.path.basename(path).encode()
+
+        with ThreadPoolExecutor(max_workers=4) as pool, \
+                mock.patch.object(images_services, "_get_render_pool", return_value=pool), \
+                mock.patch.object(images_services, "_png_content", png_content):
+            results = list(images_services.render_pngs(((i, svg, None, None, None) for i, svg in enumerate(svgs)), 64))
+
+        self.assertEqual(results, [(i, f"{i}.svg".encode()) for i in range(5)])
+
+    def test_render_pool_is_created_once_by_concurrent_threads(self):
+        def create_pool(**kwargs):
+            time.sleep(0.01)
+            return object()
+
+        with mock.patch.object(images_services, "_render_pool", None), \
+                mock.patch.object(images_services, "ProcessPoolExecutor", side_effect=create_pool) as pool_class, \
+                ThreadPoolExecutor(max_workers=4) as threads:
+            pools = list(threads.map(lambda _: images_services._get_render_pool(), range(4)))
+
+        pool_class.assert_called_once()
+        self.assertEqual(len(set(map(id, pools))), 1)
+
+
+class ZipDownloadTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/></svg>'
+
+    def test_zip_is_streamed_file_by_file(self):
+        chunks = list(archives_services.stream_zip([("a.txt", b"a" * 1000), ("b.txt", b"b" * 1000)]))
+        self.assertEqual(len(chunks), 3)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("a.txt"), b"a" * 1000)
+            self.assertEqual(archive.read("b.txt"), b"b" * 1000)
+
+    def test_download_of_a_tag_is_a_valid_zip(self):
+        for name in ["cat", "dog"]:
+            vector = Vector.objects.create(name=name, svg=ContentFile(self.svg, name=f"{name}.svg"))
+            vector.tags.add("animal")
+
+        response = self.client.get("/api/download/?tags=animal&img_format=svg&stroke=f00")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="animal.zip"')
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(sorted(archive.namelist()), ["cat.svg", "dog.svg"])
+            self.assertIn(b'fill="#f00"', archive.read("cat.svg"))
+
+
+class SvgTemplateTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/><path d="M1" fill="#fff"/></svg>'
+
+    def test_template_is_stored_on_save_and_used_to_recolor(self):
+        vector = Vector.objects.create(
+            name="vector", svg=ContentFile(self.svg, name="template.svg"), stroke_color="#f00", fill_color="#0f0"
+        )
+
+        vector.refresh_from_db()
+        self.assertEqual(vector.svg_template["slots"], "sf")
+        self.assertEqual(
+            images_services.customized_svg(vector.svg.path, "00f", "none", vector.svg_template),
+            images_services.customized_svg(vector.svg.path, "00f", "none"),
+        )
+        self.assertIn('fill="#f00"', vector.colored_svg_content)
+        self.assertIn('fill="#0f0"', vector.colored_svg_content)
+
+
+class ContentCacheTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/><path d="M1" fill="#fff"/></svg>'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches["contents"].clear()
+
+    def get_colored_svg_content(self, vector):
+        return self.client.get(f"/api/vectors/{vector.id}/").json()["coloredSvgContent"]
+
+    def test_contents_are_served_from_the_cache(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"), stroke_color="#f00")
+        content = self.get_colored_svg_content(vector)
+
+        with mock.patch.object(Vector, "_read_colored_svg_content") as read:
+            self.assertEqual(self.get_colored_svg_content(vector), content)
+        read.assert_not_called()
+
+    def test_contents_are_kept_apart_from_the_shared_cache(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"), stroke_color="#f00")
+        content = self.get_colored_svg_content(vector)
+
+        key = Vector.objects.get(id=vector.id)._content_cache_key("colored_svg_content")
+        self.assertEqual(caches["contents"].get(key), content)
+        self.assertIsNone(cache.get(key))
+
+    def test_contents_are_read_again_after_a_color_change(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"), stroke_color="#f00")
+        self.assertIn('fill="#f00"', self.get_colored_svg_content(vector))
+
+        vector.stroke_color = "#00f"
+        vector.save()
+        content = self.get_colored_svg_content(vector)
+        self.assertIn('fill="#00f"', content)
+        self.assertNotIn('fill="#f00"', content)
+
+
+class GeneratedColoredSvgTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/><path d="M1" fill="#fff"/></svg>'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches["contents"].clear()
+
+    def test_colored_svg_is_generated_on_save(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"), stroke_color="#f00")
+
+        vector.refresh_from_db()
+        with open(vector.generated_colored_svg.path) as f:
+            content = f.read()
+        self.assertIn('fill="#f00"', content)
+        self.assertIn('fill="#fff"', content)
+        self.assertEqual(vector.colored_svg_content, content)
+
+        vector.stroke_color = ""
+        vector.save()
+        vector = Vector.objects.get(id=vector.id)
+        self.assertFalse(vector.generated_colored_svg)
+        self.assertEqual(vector.colored_svg_content, "")
+
+    def test_colored_svg_is_recolored_on_read_until_it_is_generated(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"), fill_color="#0f0")
+        # Like the vectors saved before the colored svgs were generated
+        Vector.objects.filter(id=vector.id).update(generated_colored_svg="")
+
+        content = self.client.get(f"/api/vectors/{vector.id}/").json()["coloredSvgContent"]
+        self.assertIn('fill="#000"', content)
+        self.assertIn('fill="#0f0"', content)
+
+    def test_files_are_generated_again_for_a_new_svg_with_the_same_name(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"), stroke_color="#f00")
+        old_hash = Vector.objects.get(id=vector.id).content_hash
+
+        vector = Vector.objects.get(id=vector.id)
+        vector.svg = ContentFile(self.svg.replace('fill="#000"', 'fill="#030303"').replace("M1", "M2"), name="vector.svg")
+        vector.save()
+
+        vector = Vector.objects.get(id=vector.id)
+        self.assertNotEqual(vector.content_hash, old_hash)
+        with open(vector.generated_colored_svg.path) as f:
+            self.assertIn('d="M2"', f.read())
+        self.assertIn('d="M2"', vector.colored_svg_content)
+
+
+class BulkLoadVectorsTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="24px" height="24px"><path d="M{}" fill="#000"/></svg>'
+
+    def setUp(self):
+        super().setUp()
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        for index, file_name in enumerate(["cat_animal.svg", "dog_Animal-1.svg"]):
+            with open(f"{self.source_dir}/{file_name}", "w") as f:
+                f.write(self.svg.format(index))
+        # Same content as the dog
+        with open(f"{self.source_dir}/dog_Animal-2.svg", "w") as f:
+            f.write(self.svg.format(1))
+
+    def load(self):
+        call_command("load_vectors", self.source_dir, "--bulk", "--batch-size=2", stdout=io.StringIO())
+
+    def test_bulk_load_creates_the_vectors_with_their_tags(self):
+        self.load()
+
+        self.assertEqual(Vector.objects.count(), 2)
+        dog = Vector.objects.get(name="dog_Animal-1.svg")
+        self.assertEqual(sorted(dog.tags.names()), ["animal", "dog"])
+        self.assertEqual(dog.search_text, "dog animal")
+        self.assertEqual(dog.svg_template["slots"], "s")
+        self.assertTrue(dog.svg_thumbnail.name.endswith(".png"))
+        with open(dog.svg_thumbnail.path, "rb") as f:
+            self.assertTrue(f.read().startswith(b"\x89PNG"))
+        response = self.client.get("/api/vectors/?tags=animal")
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_bulk_load_skips_the_loaded_files(self):
+        self.load()
+        self.load()
+
+        self.assertEqual(Vector.objects.count(), 2)
+
+    def test_bulk_load_skips_the_files_of_vectors_without_a_hash(self):
+        with open(f"{self.source_dir}/cat_animal.svg", "rb") as f:
+            Vector.objects.create(name="cat_animal.svg", svg=ContentFile(f.read(), name="cat_animal.svg"))
+        Vector.objects.update(content_hash=None)
+
+        self.load()
+
+        self.assertEqual(Vector.objects.filter(name="cat_animal.svg").count(), 1)
+        self.assertEqual(Vector.objects.count(), 2)
+
+
+class SearchVectorsTest(TestCase):
+    def test_stored_search_vectors_match_the_tags(self):
+        vector = Vector.objects.create(name="vector", svg="vector.svg")
+        vector.tags.add("Elephants", "Árbol")
+
+        stored = Vector.objects.filter(id=vector.id).annotate(
+            simple=SearchVector("search_text", config="simple_unaccent"),
+            english=SearchVector("search_text", config="english"),
+        ).get()
+        self.assertEqual(stored.search_vector_simple, stored.simple)
+        self.assertEqual(stored.search_vector_english, stored.english)
+
+        for tags in ["elephants", "elephant", "arbol", "Árbol,elephant"]:
+            with self.subTest(tags=tags):
+                self.assertEqual(self.client.get(f"/api/vectors/?tags={tags}").json()["count"], 1)
+        self.assertEqual(self.client.get("/api/vectors/?tags=zebra").json()["count"], 0)
+
+    def test_search_vectors_follow_the_removed_tags(self):
+        vector = Vector.objects.create(name="vector", svg="vector.svg")
+        vector.tags.add("cat", "animal")
+        vector.tags.remove("cat")
+
+        self.assertEqual(self.client.get("/api/vectors/?tags=cat").json()["count"], 0)
+        self.assertEqual(self.client.get("/api/vectors/?tags=animal").json()["count"], 1)
+
+
+class SimilarityFilterTest(TestCase):
+    def setUp(self):
+        for tag in ["elephant", "zebra"]:
+            vector = Vector.objects.create(name=tag, svg=f"{tag}.svg")
+            vector.tags.add(tag)
+
+    def test_threshold_is_set_for_the_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW pg_trgm.word_similarity_threshold")
+            self.assertEqual(cursor.fetchone()[0], "0.35")
+
+    def test_similar_tags_use_the_word_similarity_operator(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/vectors/?similarity=elefant")
+        self.assertEqual([vector["name"] for vector in response.json()["results"]], ["elephant"])
+
+        sqls = [query["sql"] for query in context.captured_queries]
+        self.assertTrue(any("%>" in sql for sql in sqls))
+        self.assertFalse(any("set_config" in sql for sql in sqls))
+
+
+class BatchingTest(TestCase):
+    def count_search_text_updates(self, context):
+        return sum('SET search_text' in query['sql'] for query in context.captured_queries)
+
+    def test_tags_update_the_search_text_once_per_change(self):
+        vector = Vector.objects.create(name="vector", svg="vector.svg")
+
+        with CaptureQueriesContext(connection) as context:
+            vector.tags.add("cat", "animal")
+        self.assertEqual(self.count_search_text_updates(context), 1)
+
+        vector.refresh_from_db()
+        self.assertEqual(sorted(vector.search_text.split()), ["animal", "cat"])
+
+    def test_batch_updates_the_search_texts_once_at_the_end(self):
+        vectors = [Vector.objects.create(name="vector", svg="vector.svg") for _ in range(3)]
+
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                with batching.batch():
+                    for vector in vectors:
+                        vector.tags.add("cat")
+                        vector.tags.add("animal")
+                        vector.tags.remove("cat")
+                    self.assertEqual(self.count_search_text_updates(context), 0)
+        self.assertEqual(self.count_search_text_updates(context), 1)
+
+        self.assertEqual(set(Vector.objects.values_list("search_text", flat=True)), {"animal"})
+
+    def test_batch_bumps_the_catalog_version_after_the_other_work(self):
+        vector = Vector.objects.create(name="vector", svg="vector.svg")
+        search_texts = []
+
+        def bump_version():
+            search_texts.append(Vector.objects.get(id=vector.id).search_text)
+
+        with mock.patch.object(catalog_services, "bump_version", side_effect=bump_version):
+            with self.captureOnCommitCallbacks(execute=True):
+                with batching.batch():
+                    vector.tags.add("cat")
+        self.assertEqual(search_texts, ["cat"])
+
+
+class RebuildSearchTextTest(TestCase):
+    def test_rebuild_search_text_of_all_the_vectors(self):
+        tagged = Vector.objects.create(name="vector", svg="vector.svg")
+        tagged.tags.add("cat")
+        untagged = Vector.objects.create(name="vector", svg="vector.svg")
+        Vector.objects.update(search_text=None, search_vector_simple=None)
+
+        with self.assertNumQueries(1):
+            call_command("rebuild_search_text", stdout=io.StringIO())
+
+        tagged.refresh_from_db()
+        untagged.refresh_from_db()
+        self.assertEqual(tagged.search_text, "cat")
+        self.assertEqual(untagged.search_text, "")
+        self.assertEqual(self.client.get("/api/vectors/?tags=cat").json()["count"], 1)
+
+    def test_update_the_search_text_of_a_queryset_in_one_statement(self):
+        cat = Vector.objects.create(name="cat", svg="cat.svg")
+        cat.tags.add("cat")
+        dog = Vector.objects.create(name="dog", svg="dog.svg")
+        dog.tags.add("dog")
+        Vector.objects.update(search_text=None)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(update_search_text(Vector.objects.filter(tags__name="cat")), 1)
+
+        self.assertEqual(dict(Vector.objects.values_list("name", "search_text")), {"cat": "cat", "dog": None})
+
+
+class ThumbnailsTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="24px" height="24px"><path d="M0 0h24v24z"/></svg>'
+
+    def test_thumbnails_are_generated_on_save(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="vector.svg"))
+        vector.refresh_from_db()
+        self.assertTrue(vector.svg_thumbnail.name.endswith(".png"))
+        self.assertFalse(vector.colored_svg_thumbnail)
+
+        vector.stroke_color = "#ff0000"
+        vector.save()
+        vector.refresh_from_db()
+        self.assertTrue(vector.colored_svg_thumbnail.name.endswith(".png"))
+        with open(vector.colored_svg_thumbnail.path, "rb") as f:
+            self.assertTrue(f.read().startswith(b"\x89PNG"))
+
+
+class ExportJobTest(TempMediaMixin, TestCase):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0" fill="#000"/></svg>'
+
+    def setUp(self):
+        super().setUp()
+        # The throttling history of the new exports
+        cache.clear()
+
+    def test_export_is_made_by_the_worker(self):
+        for name in ["cat.svg", "dog.svg"]:
+            vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name=name))
+            vector.tags.add("animal")
+
+        response = self.client.post("/api/exports/", {"tags": "animal", "img_format": "svg", "stroke": "ff0000"})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "pending")
+
+        call_command("run_export_worker", "--once", "--workers=1", stdout=io.StringIO())
+
+        response = self.client.get(response["Location"])
+        self.assertEqual(response.json()["status"], "done")
+        job = ExportJob.objects.get()
+        with zipfile.ZipFile(job.file.path) as archive:
+            self.assertEqual(sorted(archive.namelist()), ["cat.svg", "dog.svg"])
+            self.assertIn(b'fill="#ff0000"', archive.read("cat.svg"))
+
+    def test_export_needs_valid_params(self):
+        response = self.client.post("/api/exports/", {"tags": "animal"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_same_export_is_reused_until_the_catalog_changes(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="cat.svg"))
+        vector.tags.add("animal")
+        params = {"tags": "animal", "img_format": "svg"}
+
+        job_id = self.client.post("/api/exports/", params).json()["id"]
+        self.assertEqual(self.client.post("/api/exports/", params).json()["id"], job_id)
+
+        call_command("run_export_worker", "--once", "--workers=1", stdout=io.StringIO())
+        self.assertEqual(self.client.post("/api/exports/", params).json()["id"], job_id)
+        self.assertNotEqual(self.client.post("/api/exports/", {**params, "stroke": "f00"}).json()["id"], job_id)
+
+        vector.tags.add("cat")
+        self.assertNotEqual(self.client.post("/api/exports/", params).json()["id"], job_id)
+
+    def test_expired_exports_are_deleted_by_the_worker(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="cat.svg"))
+        vector.tags.add("animal")
+        self.client.post("/api/exports/", {"tags": "animal", "img_format": "svg"})
+        call_command("run_export_worker", "--once", "--workers=1", stdout=io.StringIO())
+        job = ExportJob.objects.get()
+
+        call_command("run_export_worker", "--once", "--workers=1", stdout=io.StringIO())
+        self.assertTrue(ExportJob.objects.exists())
+
+        with self.settings(EXPORT_EXPIRATION=0):
+            call_command("run_export_worker", "--once", "--workers=1", stdout=io.StringIO())
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertFalse(os.path.exists(job.file.path))
+
+    def test_new_exports_are_throttled(self):
+        vector = Vector.objects.create(name="vector", svg=ContentFile(self.svg, name="cat.svg"))
+        vector.tags.add("animal")
+
+        with mock.patch.object(ScopedRateThrottle, "THROTTLE_RATES", {"exports": "2/hour"}):
+            for size in ["10", "20"]:
+                response = self.client.post("/api/exports/", {"tags": "animal", "img_format": "png", "size": size})
+                self.assertEqual(response.status_code, 202)
+            response = self.client.post("/api/exports/", {"tags": "animal", "img_format": "png", "size": "30"})
+            self.assertEqual(response.status_code, 429)
+
+            job = ExportJob.objects.first()
+            self.assertEqual(self.client.get(f"/api/exports/{job.id}/").status_code, 200)
@@ -1,53 +1,142 @@
-from django.db.models import Q
-from rest_framework import viewsets
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.throttling import ScopedRateThrottle
 from taggit.models import Tag
 
+from vectors.decorators import catalog_condition
 from vectors.serializers import (
-    FeaturedSerializer,
+    ExportJobSerializer,
     TaggitSerializer,
+    VectorContentSerializer,
     VectorSerializer,
     VectorWithNeighborsSerializer,
 )
-from vectors.filters import VectorsFilter
-from vectors.pagination import StandardResultsSetPagination
-from vectors.models import Vector, Featured
+from vectors.filters import StableOrderingFilter, VectorsFilter
+from vectors.pagination import CursorResultsSetPagination, StandardResultsSetPagination
+from vectors.models import ExportJob, Vector
+from vectors.services import catalog as catalog_services
+from vectors.services import exports as exports_services
+from vectors.services import featured as featured_services
 
 
+@method_decorator(catalog_condition, name='list')
+@method_decorator(catalog_condition, name='retrieve')
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TaggitSerializer
 
 
+@method_decorator(catalog_condition, name='list')
+@method_decorator(catalog_condition, name='retrieve')
 class VectorViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Vector.objects.all()
+    queryset = Vector.objects.defer('svg_template').prefetch_related('tags')
     pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
     filterset_class = VectorsFilter
     ordering_fields= ['uploaded']
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = CursorResultsSetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_serializer_class(self):
         if self.action == "retrieve":
             return VectorWithNeighborsSerializer
         return VectorSerializer
 
     @action(detail=False, methods=['get'])
+    @method_decorator(catalog_condition)
     def latest(self, request):
-        latest = self.get_queryset().order_by('-uploaded')[0:12].all()
+        latest = self.get_queryset().order_by('-uploaded', '-id')[0:12].all()
         serializer = self.get_serializer(latest, many=True)
         return Response(serializer.data, status=200)
 
     @action(detail=False, methods=['get'])
+    @method_decorator(catalog_condition)
     def featured(self, request):
-        featured = Featured.objects.all().order_by('order')
-        serializer = FeaturedSerializer(
-            featured,
-            many=True,
-            context={'request': request}
-        )
+        payload = featured_services.get_payload(request)
+        return Response(payload, status=200)
+
+    @action(detail=False, methods=['get'])
+    @method_decorator(catalog_condition)
+    def contents(self, request):
+        # parse params
+        try:
+            ids = [int(id) for id in request.query_params.get('ids', '').split(',') if id]
+        except ValueError:
+            return Response({'errors': ['ids must be a list of numbers']}, status=400)
+
+        max_ids = StandardResultsSetPagination.max_page_size
+        if not ids or len(ids) > max_ids:
+            return Response({'errors': [f'ids is mandatory, with up to {max_ids} ids']}, status=400)
+
+        vectors = list(Vector.objects.defer('svg_template').filter(id__in=ids))
+
+        # read the svg files concurrently (they are cached in the vectors)
+        def read_contents(vector):
+            return vector.svg_content, vector.colored_svg_content
+
+        with ThreadPoolExecutor(max_workers=settings.CONTENT_READ_WORKERS) as executor:
+            list(executor.map(read_contents, vectors))
+
+        serializer = VectorContentSerializer(vectors, many=True)
         return Response(serializer.data, status=200)
 
     @action(detail=False, methods=['get'])
+    @method_decorator(catalog_condition)
     def total(self, request):
-        total_vectors = self.queryset.count()
+        total_vectors = catalog_services.get_total_vectors()
         return Response({'total_vectors': total_vectors}, status=200)
+
+
+class ExportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Bulk downloads made in the background: create one with the params of the download
+    endpoint, poll it until its status is `done` and then download its `file`.
+    """
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    filter_backends = []
+    throttle_scope = 'exports'
+
+    def get_throttles(self):
+        # Only the new exports are limited (EXPORTS_THROTTLE_RATE), not their polling
+        if self.action == 'create':
+            return [ScopedRateThrottle()]
+        return super().get_throttles()
+
+    def create(self, request):
+        # parse params
+        params = {
+            key: str(request.data[key])
+            for key in exports_services.PARAMS
+            if request.data.get(key) not in (None, False, '')
+        }
+        ok, errors = exports_services.parse_params(params)
+        if not ok:
+            return Response({'errors': errors}, status=400)
+
+        if not exports_services.get_vectors(params).exists():
+            return Response({'error': 'there are no vectors with these params'}, status=400)
+
+        if 'tags' in params:
+            name = f'{"_".join(params["tags"].split(","))}.zip'
+        else:
+            name = f'vector-{params["id"]}.zip'
+
+        job = exports_services.submit(params, name)
+        serializer = self.get_serializer(job)
+        headers = {'Location': reverse('export-detail', kwargs={'pk': job.pk}, request=request)}
+        return Response(serializer.data, status=202, headers=headers)